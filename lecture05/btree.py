@@ -44,7 +44,8 @@ class BTree(object):
   in the other programs
 
   """
-  def __init__(self, t):
+  def __init__(self, t, Node=BTreeNode):
+    self.Node = Node
     self.root = None
     self.t = t
 
@@ -64,7 +65,7 @@ class BTree(object):
 
     """
     if self.root is None:
-      self.root = BTreeNode(self.t)
+      self.root = self.Node(self.t)
     self.root = self.root.insert(key)
 
   def remove(self, key):
@@ -73,7 +74,7 @@ class BTree(object):
         'key {} is not in B-tree'.format(key))
     self.root = self.root.remove(key)
     if self.root.n == 0:
-      self.root = self.root.children[0]
+      self.root = None if self.root.is_leaf() else self.root.children[0]
 
   def traverse(self):
     """
@@ -83,3 +84,38 @@ class BTree(object):
     if self.root is None:
       return ''
     return self.root.traverse()
+
+  def iter_keys(self):
+    """
+    Lazily yield every key in the tree inorder
+
+    Unlike traverse this does not build a string
+    or check that the tree is balanced
+
+    """
+    return self.range()
+
+  def range(self, lo=None, hi=None):
+    """
+    Lazily yield the keys k in the tree such that
+    lo <= k <= hi in ascending order. The cursor descends
+    from the root once and then walks the tree inorder
+
+    Complexity: O(log(N) + K) where K is the number of keys yielded
+
+    """
+    if self.root is None:
+      return iter(())
+    return self.root.range(lo, hi)
+
+  def reverse_range(self, lo=None, hi=None):
+    """
+    Lazily yield the keys k in the tree such that
+    lo <= k <= hi in descending order
+
+    Complexity: O(log(N) + K) where K is the number of keys yielded
+
+    """
+    if self.root is None:
+      return iter(())
+    return self.root.reverse_range(lo, hi)
@@ -26,6 +26,17 @@ class BTreeInsertNode(BTreeSearchNode):
     """
     return BTreeInsertNode(self.t)
 
+  def _writable_child(self, i):
+    """
+    Return child i so that it can be modified in place.
+    Every write goes through this function before it
+    changes a child, so nodes which share their children
+    with other trees (see snapshot.py) can override it
+    to copy the child first
+
+    """
+    return self.children[i]
+
   def _insert_non_full(self, key):
     """
     This is an auxilary function for the .insert()
@@ -43,10 +54,10 @@ class BTreeInsertNode(BTreeSearchNode):
       # Otherwise insert it into the proper child
       child = self.children[i + 1]
       if child.n == self.max_capacity:
-        self._split_child(child, i + 1)
+        self._split_child(self._writable_child(i + 1), i + 1)
       if i != self.n - 1 and self.keys[i + 1] < key:
         i += 1
-      self.children[i + 1]._insert_non_full(key)
+      self._writable_child(i + 1)._insert_non_full(key)
 
   def _split_child(self, child, i):
     """
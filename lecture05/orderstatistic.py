@@ -0,0 +1,229 @@
+"""
+B-Tree: Order Statistics
+------------------------
+A B-tree where each node also stores the number
+of keys in its subtree, like the order-statistic
+AVL tree in lecture 9. With the subtree sizes the
+tree can find the rank of a key, or the key with
+a given rank, visiting one node per level.
+
+Since each node has up to (2 * t) children, the
+tree has height O(log_t(N)) which is much shallower
+than a binary tree with the same number of keys.
+
+"""
+
+
+from bisect import bisect_left
+
+from btree import BTree
+from remove import BTreeDeleteNode
+
+
+class BTreeOrderStatNode(BTreeDeleteNode):
+  """
+  Inherits from BTreeDeleteNode in remove.py
+
+  Each method which moves keys between nodes
+  (split, merge, and borrow) recomputes the size
+  of the nodes it changes, and inserts and removes
+  recompute the sizes on their way back up
+
+  """
+  def __init__(self, t):
+    BTreeDeleteNode.__init__(self, t)
+    self.size = 0
+
+  def _create_new(self):
+    """
+    Overwrite _create_new for the insertion
+    and deletion methods
+
+    """
+    return BTreeOrderStatNode(self.t)
+
+  def _update_size(self):
+    """
+    Recompute the size of the subtree from
+    the sizes of this node's children
+
+    Complexity: O(t)
+
+    """
+    self.size = self.n + sum(child.size for child in self.children)
+
+  def _split_child(self, child, i):
+    """
+    Split child i, then recompute the size
+    of both halves
+
+    """
+    BTreeDeleteNode._split_child(self, child, i)
+    child._update_size()
+    self.children[i + 1]._update_size()
+
+  def _insert_non_full(self, key):
+    """
+    Insert into the subtree then recompute
+    this node's size on the way back up
+
+    """
+    BTreeDeleteNode._insert_non_full(self, key)
+    self._update_size()
+
+  def insert(self, key):
+    """
+    Insert a key, the size of the root is
+    recomputed in case the root was split
+
+    """
+    node = BTreeDeleteNode.insert(self, key)
+    node._update_size()
+    return node
+
+  def _borrow_from_prev(self, i):
+    """
+    Borrow a key from child i - 1, then
+    recompute the size of both children
+
+    """
+    BTreeDeleteNode._borrow_from_prev(self, i)
+    self.children[i - 1]._update_size()
+    self.children[i]._update_size()
+
+  def _borrow_from_next(self, i):
+    """
+    Borrow a key from child i + 1, then
+    recompute the size of both children
+
+    """
+    BTreeDeleteNode._borrow_from_next(self, i)
+    self.children[i]._update_size()
+    self.children[i + 1]._update_size()
+
+  def _merge(self, i):
+    """
+    Merge children i and i + 1, then
+    recompute the size of the merged child
+
+    """
+    BTreeDeleteNode._merge(self, i)
+    self.children[i]._update_size()
+
+  def remove(self, key):
+    """
+    Remove a key from the subtree then recompute
+    this node's size on the way back up
+
+    """
+    node = BTreeDeleteNode.remove(self, key)
+    node._update_size()
+    return node
+
+  def rank(self, key):
+    """
+    Return the number of keys in the subtree
+    which are less than key, the key does not
+    need to be in the tree
+
+    Complexity: O(t * log_t(N))
+
+    """
+    r = 0
+    node = self
+    while True:
+      i = bisect_left(node.keys, key)
+      r += i
+      if node.is_leaf():
+        return r
+      r += sum(node.children[k].size for k in range(i))
+      node = node.children[i]
+
+  def _path_to_rank(self, i):
+    """
+    Descend to the key with rank i and return the path
+    as a stack of (node, i) pairs which can be passed to
+    _iter_path in search.py, so the key with rank i is
+    the first key the iterator yields
+
+    Assumes 0 <= i < self.size
+
+    """
+    stack = []
+    node = self
+    while not node.is_leaf():
+      k = 0
+      while i > node.children[k].size:
+        i -= node.children[k].size + 1
+        k += 1
+      stack.append((node, k))
+      if i == node.children[k].size:
+        return stack
+      node = node.children[k]
+    stack.append((node, i))
+    return stack
+
+  def select(self, i):
+    """
+    Return the key with rank i in the subtree
+
+    Complexity: O(t * log_t(N))
+
+    """
+    node, k = self._path_to_rank(i)[-1]
+    return node.keys[k]
+
+  def iter_from_rank(self, i, hi=None):
+    """
+    Lazily yield the keys in the subtree inorder starting
+    with the key of rank i and stopping after the last key <= hi
+
+    Complexity: O(t * log_t(N) + K) where K is the number of keys yielded
+
+    """
+    return BTreeDeleteNode._iter_path(self._path_to_rank(i), hi)
+
+
+class OrderStatisticBTree(BTree):
+  """
+  Order-statistic B-tree can do normal B-tree
+  operations and can also compute the rank of a
+  key or select the key with a given rank
+
+  """
+  def __init__(self, t):
+    BTree.__init__(self, t, BTreeOrderStatNode)
+
+  def __len__(self):
+    return 0 if self.root is None else self.root.size
+
+  def rank(self, key):
+    """
+    Return the number of keys in the tree less than key
+
+    """
+    if self.root is None:
+      return 0
+    return self.root.rank(key)
+
+  def select(self, i):
+    """
+    Return the key with rank i in the tree
+
+    """
+    if i < 0 or i >= len(self):
+      raise IndexError(
+        'Rank {} out of range'.format(i))
+    return self.root.select(i)
+
+  def iter_from_rank(self, i, hi=None):
+    """
+    Lazily yield the keys in the tree inorder starting
+    with the key of rank i, i.e. a range iterator whose
+    lower bound is select(i)
+
+    """
+    if i < 0 or i >= len(self):
+      raise IndexError(
+        'Rank {} out of range'.format(i))
+    return self.root.iter_from_rank(i, hi)
@@ -71,8 +71,8 @@ class BTreeDeleteNode(BTreeInsertNode):
     node of the sibling and adds it as the leftmost child node
 
     """
-    child = self.children[i]
-    sibling = self.children[i - 1]
+    child = self._writable_child(i)
+    sibling = self._writable_child(i - 1)
 
     child.keys = [self.keys[i - 1]] + child.keys
     self.keys[i - 1] = sibling.keys.pop()
@@ -90,15 +90,14 @@ class BTreeDeleteNode(BTreeInsertNode):
     If child is not a leaf, it also appends the siblings leftmost child
 
     """
-    child = self.children[i]
-    sibling = self.children[i + 1]
+    child = self._writable_child(i)
+    sibling = self._writable_child(i + 1)
 
     child.keys = child.keys + [self.keys[i]]
     self.keys[i] = sibling.keys.pop(0)
 
     if not child.is_leaf():
-      child.children = \
-        child.children.append(sibling.children.pop(0))
+      child.children.append(sibling.children.pop(0))
 
   def _merge(self, i):
     """
@@ -110,7 +109,7 @@ class BTreeDeleteNode(BTreeInsertNode):
     to remove the gap created by merging two children
 
     """
-    child = self.children[i]
+    child = self._writable_child(i)
     sibling = self.children[i + 1]
     child.keys.append(self.keys.pop(i))
     child.keys += sibling.keys
@@ -153,7 +152,7 @@ class BTreeDeleteNode(BTreeInsertNode):
       # from the child node recursively
       pred = self._get_predecessor(i)
       self.keys[i] = pred
-      self.children[i] = self.children[i].remove(pred)
+      self.children[i] = self._writable_child(i).remove(pred)
       return self
     if self.children[i + 1].n >= self.t:
       # If the child to the right of the node has >= t keys, get the
@@ -161,13 +160,13 @@ class BTreeDeleteNode(BTreeInsertNode):
       # delete the successor from the child node recursively
       succ = self._get_successor(i)
       self.keys[i] = succ
-      self.children[i + 1] = self.children[i + 1].remove(succ)
+      self.children[i + 1] = self._writable_child(i + 1).remove(succ)
       return self
     # If both children do not have enough keys, merge key and both children into
     # child i, afterwards child i will have (2 * t) - 1 keys. Then recursively
     # delete the key from the newly merged child
     self._merge(i)
-    self.children[i] = self.children[i].remove(key)
+    self.children[i] = self._writable_child(i).remove(key)
     return self
 
   def remove(self, key):
@@ -190,7 +189,7 @@ class BTreeDeleteNode(BTreeInsertNode):
       self._fill(i)
     if key_in_last_child and i > self.n:
       i -= 1
-    self.children[i] = self.children[i].remove(key)
+    self.children[i] = self._writable_child(i).remove(key)
     if len(self.children) == 1:  # case when root has only one child
       return self.children[0]
     return self
@@ -6,6 +6,9 @@ A B-tree class which only implements searching
 """
 
 
+from bisect import bisect_left, bisect_right
+
+
 class BTreeSearchNode(object):
   """
   B-tree node initialized with a list to keep track of keys,
@@ -76,3 +79,115 @@ class BTreeSearchNode(object):
     if not self.is_leaf():
       result += self.children[-1].traverse(False)
     return result
+
+  def _path_to_lower_bound(self, lo):
+    """
+    Descend once from this node to the first key >= lo
+    and return the path as a stack of (node, i) pairs,
+    where keys[i] is the next key to yield from that node
+    once the subtree at children[i] has been consumed
+
+    If lo is None the path leads to the smallest key
+
+    """
+    stack = []
+    node = self
+    while True:
+      i = 0 if lo is None else bisect_left(node.keys, lo)
+      stack.append((node, i))
+      if node.is_leaf():
+        return stack
+      node = node.children[i]
+
+  def _path_to_upper_bound(self, hi):
+    """
+    Mirror image of _path_to_lower_bound, descends
+    to the last key <= hi. Each (node, i) pair on the
+    stack means keys[i - 1] is the next key to yield
+    once the subtree at children[i] has been consumed
+
+    """
+    stack = []
+    node = self
+    while True:
+      i = node.n if hi is None else bisect_right(node.keys, hi)
+      stack.append((node, i))
+      if node.is_leaf():
+        return stack
+      node = node.children[i]
+
+  @staticmethod
+  def _iter_path(stack, hi=None):
+    """
+    Yield keys inorder starting from a path built by
+    _path_to_lower_bound, stopping after the last key <= hi
+
+    The stack never holds more than one entry per level,
+    so the extra memory is O(log(N)) regardless of how
+    many keys are yielded
+
+    """
+    while stack:
+      node, i = stack.pop()
+      if i >= node.n:
+        continue
+      key = node.keys[i]
+      if hi is not None and key > hi:
+        return
+      yield key
+      stack.append((node, i + 1))
+      if not node.is_leaf():
+        # the next key is the leftmost key of the child to the right
+        child = node.children[i + 1]
+        while True:
+          stack.append((child, 0))
+          if child.is_leaf():
+            break
+          child = child.children[0]
+
+  @staticmethod
+  def _iter_path_reversed(stack, lo=None):
+    """
+    Yield keys in reverse order starting from a path built
+    by _path_to_upper_bound, stopping after the last key >= lo
+
+    """
+    while stack:
+      node, i = stack.pop()
+      if i == 0:
+        continue
+      key = node.keys[i - 1]
+      if lo is not None and key < lo:
+        return
+      yield key
+      stack.append((node, i - 1))
+      if not node.is_leaf():
+        # the next key is the rightmost key of the child to the left
+        child = node.children[i - 1]
+        while True:
+          stack.append((child, child.n))
+          if child.is_leaf():
+            break
+          child = child.children[child.n]
+
+  def range(self, lo=None, hi=None):
+    """
+    Lazily yield the keys k in the subtree such that
+    lo <= k <= hi in ascending order. Either bound
+    can be None to leave that side of the range open
+
+    Complexity: O(log(N) + K) where K is the number of keys yielded
+
+    """
+    return BTreeSearchNode._iter_path(
+      self._path_to_lower_bound(lo), hi)
+
+  def reverse_range(self, lo=None, hi=None):
+    """
+    Same as range but yields the keys in descending order
+
+    Complexity: O(log(N) + K) where K is the number of keys yielded
+
+    """
+    return BTreeSearchNode._iter_path_reversed(
+      self._path_to_upper_bound(hi), lo)
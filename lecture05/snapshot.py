@@ -0,0 +1,146 @@
+"""
+B-Tree: Copy-on-Write Snapshots
+-------------------------------
+A B-tree whose writes never modify a node that
+a reader could be looking at. Instead each insert
+or remove copies the nodes along the path it changes
+(path copying) and then publishes the new root with
+a single assignment, which is atomic in CPython.
+
+Nodes which are not on the path are shared between
+the old and the new version of the tree, so a write
+copies O(log(N)) nodes of O(t) keys each, and taking
+a snapshot is O(1): it is just the current root.
+
+Any number of reader threads can scan a snapshot
+while one writer keeps modifying the tree, without
+taking a lock.
+
+"""
+
+
+from threading import Lock
+
+from btree import BTree
+from remove import BTreeDeleteNode
+
+
+class BTreeCopyOnWriteNode(BTreeDeleteNode):
+  """
+  Inherits from BTreeDeleteNode in remove.py
+
+  Each node stores the write which created it, the owner.
+  A write may only modify nodes it owns, any other node
+  it needs to change is copied first
+
+  """
+  def __init__(self, t, owner=None):
+    BTreeDeleteNode.__init__(self, t)
+    self.owner = owner
+
+  def _create_new(self):
+    """
+    Nodes created during a write belong to that write
+
+    """
+    return BTreeCopyOnWriteNode(self.t, self.owner)
+
+  def _copy(self, owner):
+    """
+    Shallow copy of this node owned by a new write,
+    the children are shared with the original node
+
+    """
+    node = BTreeCopyOnWriteNode(self.t, owner)
+    node.keys = list(self.keys)
+    node.children = list(self.children)
+    return node
+
+  def _writable_child(self, i):
+    """
+    Replace child i with a copy owned by the
+    same write as this node, unless it already is
+
+    """
+    child = self.children[i]
+    if child.owner is not self.owner:
+      child = child._copy(self.owner)
+      self.children[i] = child
+    return child
+
+
+class BTreeSnapshot(object):
+  """
+  Read-only view of a B-tree at the time
+  the snapshot was taken
+
+  """
+  def __init__(self, root):
+    self.root = root
+
+  search = BTree.search
+  traverse = BTree.traverse
+  iter_keys = BTree.iter_keys
+  range = BTree.range
+  reverse_range = BTree.reverse_range
+
+
+class CopyOnWriteBTree(BTree):
+  """
+  B-tree which path-copies on every write so that
+  snapshots of the tree stay consistent
+
+  Writers are serialized with a lock, readers
+  never need to take it
+
+  """
+  def __init__(self, t):
+    BTree.__init__(self, t)
+    self._write_lock = Lock()
+
+  def _begin_write(self):
+    """
+    Return a copy of the root owned by a new write
+
+    """
+    owner = object()
+    if self.root is None:
+      return BTreeCopyOnWriteNode(self.t, owner)
+    return self.root._copy(owner)
+
+  def insert(self, key):
+    """
+    Insert a key into a new version of the tree
+    then publish its root
+
+    """
+    with self._write_lock:
+      self.root = self._begin_write().insert(key)
+
+  def remove(self, key):
+    """
+    Remove a key from a new version of the tree
+    then publish its root
+
+    If the key is not in the tree, the KeyError is raised
+    before anything is published, so the tree is unchanged
+
+    """
+    with self._write_lock:
+      if self.root is None:
+        raise KeyError(
+          'key {} is not in B-tree'.format(key))
+      root = self._begin_write().remove(key)
+      if root.n == 0:
+        root = None if root.is_leaf() else root.children[0]
+      self.root = root
+
+  def snapshot(self):
+    """
+    Return a read-only view of the current version of
+    the tree, later writes will not be visible through it
+
+    Complexity: O(1)
+
+    """
+    return BTreeSnapshot(self.root)
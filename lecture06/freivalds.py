@@ -10,6 +10,7 @@ that A * B = C
 
 
 from random import getrandbits
+import numpy as np
 
 
 def generate_random_bit_vector(n):
@@ -38,9 +39,9 @@ def subtract_matrices(u, v):
   Subtract two n-dimensional vectors
 
   """
-  return sum([
+  return [
     u[i] - v[i]
-    for i in range(len(u))])
+    for i in range(len(u))]
 
 
 def freivalds(A, B, C, k=10):
@@ -60,8 +61,165 @@ def freivalds(A, B, C, k=10):
   result = True
   for _ in range(k):
     r = generate_random_bit_vector(n)
-    a = matrix_vector_multiply(A, r)
-    b = matrix_vector_multiply(B, a)
+    b = matrix_vector_multiply(B, r)
+    a = matrix_vector_multiply(A, b)
     c = matrix_vector_multiply(C, r)
-    result &= subtract_matrices(b, c) == 0
+    result &= not any(subtract_matrices(a, c))
+  return result
+
+
+def _check_integer_dtype(*matrices):
+  """
+  Raise TypeError unless every matrix holds integers, either
+  with an integer dtype or as Python ints with dtype object.
+  Floating point products are rounded, so they cannot be
+  compared exactly
+
+  """
+  for M in matrices:
+    if M.dtype != object and not np.issubdtype(M.dtype, np.integer):
+      raise TypeError(
+        'matrices must have an integer or object dtype, got {}'.format(
+          M.dtype))
+
+
+def vectorized_freivalds(A, B, C, k=10, block=2, seed=None):
+  """
+  Same as freivalds above but with NumPy arrays,
+  all k random bit vectors are drawn at once as
+  the columns of an n * k matrix R, so the k trials
+  become three matrix products:
+
+  A * (B * R) - (C * R)
+
+  The columns of R are checked in blocks of the
+  given size and the function returns False after
+  the first block which contains a column where
+  the product differs. The small default block lets
+  a wrong C be rejected after a couple of columns,
+  block=k batches all k trials into one product
+
+  Arrays with dtype int64 are multiplied with NumPy's
+  native integer arithmetic, which wraps on overflow,
+  arrays with dtype object hold Python ints and are
+  exact for entries of any size but much slower.
+  Other dtypes, such as floats, raise a TypeError
+
+  Complexity: O(k * n ** 2)
+
+  """
+  A, B, C = np.asarray(A), np.asarray(B), np.asarray(C)
+  _check_integer_dtype(A, B, C)
+  n = A.shape[0]
+  dtype = object if object in (A.dtype, B.dtype, C.dtype) else np.int64
+  rng = np.random.default_rng(seed)
+  R = rng.integers(0, 2, size=(n, k)).astype(dtype)
+  for lo in range(0, k, block):
+    R_block = R[:, lo:lo + block]
+    if np.any(A.dot(B.dot(R_block)) != C.dot(R_block)):
+      return False
+  return True
+
+
+# Largest prime which fits the assumptions of modular_dot below
+MERSENNE_PRIME_31 = (1 << 31) - 1
+
+
+def modular_dot(X, Y, p):
+  """
+  Compute X * Y mod p for int64 matrices whose
+  entries are in [0, p) without overflowing, given
+  that p < 2 ** 31
+
+  Y is split into 16-bit halves and the inner
+  dimension is summed in chunks of 2 ** 16, so
+  each partial sum is less than 2 ** 63
+
+  """
+  chunk = 1 << 16
+  Y_lo = Y & 0xffff
+  Y_hi = Y >> 16
+  result = np.zeros((X.shape[0], Y.shape[1]), dtype=np.int64)
+  for lo in range(0, X.shape[1], chunk):
+    X_chunk = X[:, lo:lo + chunk]
+    result += X_chunk.dot(Y_lo[lo:lo + chunk]) % p
+    result += (X_chunk.dot(Y_hi[lo:lo + chunk]) % p) << 16
+    result %= p
   return result
+
+
+def _read_rows(M, lo, hi, modulus):
+  """
+  Read rows lo to hi - 1 of a (possibly memory-mapped)
+  matrix into memory as int64, reducing each entry
+  mod modulus if one is given
+
+  """
+  rows = np.asarray(M[lo:hi])
+  if modulus is not None:
+    rows = np.mod(rows, modulus)
+  return rows.astype(np.int64)
+
+
+def out_of_core_freivalds(A, B, C, k=10, block_rows=1024,
+                          modulus=None, seed=None):
+  """
+  Freivalds' algorithm for matrices which do not fit
+  in memory. A, B, and C can be numpy.memmap arrays
+  or paths to .npy files, which are memory-mapped
+
+  Only matrix-vector products are needed, so each
+  matrix is read once, sequentially, in blocks of
+  block_rows rows. The first pass computes B * R, the
+  second computes A * (B * R) and C * R block by block
+  and returns False on the first block which differs.
+  Besides one block of rows, the only memory used is
+  the n * k matrices R and B * R
+
+  If a prime modulus (< 2 ** 31) is given, all arithmetic
+  is done in the field of integers mod p, so matrices with
+  huge entries can be checked without overflowing int64.
+  The entries of R are then drawn from {0, ..., 2 ** 16 - 1}
+  instead of {0, 1}, so each trial has at most a 1 / (2 ** 16)
+  probability of error instead of 1 / 2
+
+  The matrices must hold integers, a TypeError is raised for
+  other dtypes such as floats. Arrays with dtype object cannot
+  be memory-mapped, so matrices with huge entries must either
+  be stored on disk as int64 or passed as in-memory object
+  arrays of Python ints, which are reduced mod p block by block
+
+  Complexity: O(k * n ** 2) time, O(n * (k + block_rows)) memory
+
+  """
+  if isinstance(A, str):
+    A = np.load(A, mmap_mode='r')
+  if isinstance(B, str):
+    B = np.load(B, mmap_mode='r')
+  if isinstance(C, str):
+    C = np.load(C, mmap_mode='r')
+  _check_integer_dtype(A, B, C)
+  if modulus is not None and not 1 < modulus <= MERSENNE_PRIME_31:
+    raise ValueError(
+      'modulus must be a prime less than 2 ** 31, got {}'.format(modulus))
+
+  def dot(X, Y):
+    if modulus is None:
+      return X.dot(Y)
+    return modular_dot(X, Y, modulus)
+
+  n = A.shape[0]
+  rng = np.random.default_rng(seed)
+  high = 2 if modulus is None else min(modulus, 1 << 16)
+  R = rng.integers(0, high, size=(n, k), dtype=np.int64)
+  BR = np.empty((n, k), dtype=np.int64)
+  for lo in range(0, n, block_rows):
+    hi = min(lo + block_rows, n)
+    BR[lo:hi] = dot(_read_rows(B, lo, hi, modulus), R)
+  for lo in range(0, n, block_rows):
+    hi = min(lo + block_rows, n)
+    ABR = dot(_read_rows(A, lo, hi, modulus), BR)
+    CR = dot(_read_rows(C, lo, hi, modulus), R)
+    if np.any(ABR != CR):
+      return False
+  return True
@@ -14,12 +14,13 @@ def select(S, i, key=lambda x: x):
   if len(medians) <= 5:
     x = medians[len(medians) // 2]
   else:
-    x = select(medians, len(medians) // 2)
-  L = [y for y in S if y < x]
-  R = [y for y in S if y > x]
+    x = select(medians, len(medians) // 2, key)
+  L = [y for y in S if key(y) < key(x)]
+  R = [y for y in S if key(y) > key(x)]
   k = len(L)
-  if k > i:
-    return select(L, i)
-  if k < i:
-    return select(R, i - k)
+  equal = len(S) - k - len(R)
+  if i < k:
+    return select(L, i, key)
+  if i >= k + equal:
+    return select(R, i - k - equal, key)
   return x
@@ -8,8 +8,10 @@ quicksort
 """
 
 
+from math import log
 from random import randint
-from median import select
+from time import time
+import sys
 
 
 def basic_partition(L, lo, hi):
@@ -71,16 +73,12 @@ def basic_quicksort_with_shuffle(L):
 def intelligent_partition(L, lo, hi):
   """
   "Intelligent" partition by selecting
-  the median as the pivot value using
-  the O(n) algorithm from lecture 2
+  the median of L[lo:hi + 1] as the pivot value
+  using the O(n) algorithm from lecture 2, run
+  in place on the range (see select_in_place below)
 
   """
-  if hi == lo + 1:
-    pivot = L[hi]
-    i = hi
-  else:
-    pivot = select(L, (lo + hi) // 2)
-    i = L.index(pivot)
+  i = select_in_place(L, None, lo, hi, (lo + hi) // 2)
   L[i], L[hi] = L[hi], L[i]
   pivot = L[hi]
   k = lo - 1
@@ -113,26 +111,27 @@ def intelligent_quicksort(L, lo, hi):
 def random_partition(L, lo, hi):
   """
   This implementation chooses a random element
-  to be the pivot, and repeats until it tries
-  either the resulting partitions are at least
-  a quarter of the length of the list or
+  to be the pivot, and repeats until either
+  the resulting partitions are at least
+  a quarter of the length of the range or
   it tried hi - lo times.
 
   """
-  i = randint(lo, hi)
-  L[i], L[hi] = L[hi], L[i]
-  pivot = L[hi]
-  k = lo - 1
-  for m in range(lo, hi):
-    if L[m] < pivot:
-      k += 1
-      L[k], L[m] = L[m], L[k]
-  L[hi], L[k + 1] = L[k + 1], L[hi]
-  n = len(L) // 4
-  if (hi - lo > 4) \
-    and (((i + 1) - lo) < n
-      or (hi - (i + 1)) < n):
-        return random_partition(L, lo, hi)
+  n = (hi - lo + 1) // 4
+  for _ in range(hi - lo):
+    i = randint(lo, hi)
+    L[i], L[hi] = L[hi], L[i]
+    pivot = L[hi]
+    k = lo - 1
+    for m in range(lo, hi):
+      if L[m] < pivot:
+        k += 1
+        L[k], L[m] = L[m], L[k]
+    L[hi], L[k + 1] = L[k + 1], L[hi]
+    if hi - lo <= 4 \
+      or (((k + 1) - lo) >= n
+        and (hi - (k + 1)) >= n):
+          break
   return k + 1
 
 
@@ -151,3 +150,328 @@ def random_quicksort(L, lo, hi):
     pivot = random_partition(L, lo, hi)
     random_quicksort(L, lo, pivot - 1)
     random_quicksort(L, pivot + 1, hi)
+
+
+# Ranges with at most this many elements are sorted with insertion sort
+INSERTION_SORT_CUTOFF = 16
+
+# Ranges with more than this many elements use Tukey's ninther as the pivot
+NINTHER_CUTOFF = 128
+
+
+def _insertion_sort(K, V, lo, hi):
+  """
+  Sort K[lo:hi + 1] with insertion sort, applying
+  the same moves to V if it is not None
+
+  This is faster than quicksort for short ranges
+
+  """
+  for i in range(lo + 1, hi + 1):
+    k = K[i]
+    if V is not None:
+      v = V[i]
+    j = i - 1
+    while j >= lo and k < K[j]:
+      K[j + 1] = K[j]
+      if V is not None:
+        V[j + 1] = V[j]
+      j -= 1
+    K[j + 1] = k
+    if V is not None:
+      V[j + 1] = v
+
+
+def _sift_down(K, V, lo, root, end):
+  """
+  Sift the element at offset root of the heap
+  stored in K[lo:lo + end] down to its place
+
+  """
+  while True:
+    child = 2 * root + 1
+    if child >= end:
+      return
+    if child + 1 < end and K[lo + child] < K[lo + child + 1]:
+      child += 1
+    if not K[lo + root] < K[lo + child]:
+      return
+    i, k = lo + root, lo + child
+    K[i], K[k] = K[k], K[i]
+    if V is not None:
+      V[i], V[k] = V[k], V[i]
+    root = child
+
+
+def _heapsort(K, V, lo, hi):
+  """
+  Sort K[lo:hi + 1] in place with heapsort, applying
+  the same moves to V if it is not None
+
+  Complexity: O(n * log(n)) in the worst case
+
+  """
+  n = hi - lo + 1
+  for root in range(n // 2 - 1, -1, -1):
+    _sift_down(K, V, lo, root, n)
+  for end in range(n - 1, 0, -1):
+    k = lo + end
+    K[lo], K[k] = K[k], K[lo]
+    if V is not None:
+      V[lo], V[k] = V[k], V[lo]
+    _sift_down(K, V, lo, 0, end)
+
+
+def _median_of_three(K, a, b, c):
+  """
+  Return whichever index of a, b, c holds
+  the median of the three keys
+
+  """
+  if K[a] < K[b]:
+    if K[b] < K[c]:
+      return b
+    return c if K[a] < K[c] else a
+  if K[a] < K[c]:
+    return a
+  return c if K[b] < K[c] else b
+
+
+def _choose_pivot(K, lo, hi):
+  """
+  Return the index of the pivot for K[lo:hi + 1],
+  the median of the first, middle, and last keys,
+  or for large ranges Tukey's ninther, the median
+  of three medians of three. This makes sorted and
+  reversed inputs split evenly
+
+  """
+  mid = (lo + hi) // 2
+  if hi - lo + 1 <= NINTHER_CUTOFF:
+    return _median_of_three(K, lo, mid, hi)
+  step = (hi - lo + 1) // 8
+  return _median_of_three(
+    K,
+    _median_of_three(K, lo, lo + step, lo + 2 * step),
+    _median_of_three(K, mid - step, mid, mid + step),
+    _median_of_three(K, hi - 2 * step, hi - step, hi),
+  )
+
+
+def three_way_partition(K, V, lo, hi, p):
+  """
+  Dutch national flag partition of K[lo:hi + 1] around
+  the key at index p, applying the same moves to V if it
+  is not None. Returns (lt, gt) such that afterwards
+
+  K[lo:lt] < pivot, K[lt:gt + 1] == pivot, K[gt + 1:hi + 1] > pivot
+
+  Keys equal to the pivot end up in the middle and
+  are never looked at again, so lists with many
+  duplicates take O(n * log(d)) time where d is the
+  number of distinct keys
+
+  """
+  pivot = K[p]
+  lt, i, gt = lo, lo, hi
+  while i <= gt:
+    k = K[i]
+    if k < pivot:
+      K[lt], K[i] = k, K[lt]
+      if V is not None:
+        V[lt], V[i] = V[i], V[lt]
+      lt += 1
+      i += 1
+    elif pivot < k:
+      K[gt], K[i] = k, K[gt]
+      if V is not None:
+        V[gt], V[i] = V[i], V[gt]
+      gt -= 1
+    else:
+      i += 1
+  return lt, gt
+
+
+def median_of_medians(K, V, lo, hi):
+  """
+  Find a pivot for K[lo:hi + 1] with the median of medians
+  algorithm from lecture 2, but in place: each group of 5
+  is sorted with insertion sort and its median is swapped
+  to the front of the range, then the median of the medians
+  is selected recursively. Returns the index of the pivot,
+  at least 3 / 10 of the range is <= it and 3 / 10 is >= it
+
+  The same moves are applied to V if it is not None
+
+  Complexity: O(n)
+
+  """
+  if hi - lo + 1 <= 5:
+    _insertion_sort(K, V, lo, hi)
+    return (lo + hi) // 2
+  m = lo
+  for start in range(lo, hi + 1, 5):
+    end = min(start + 4, hi)
+    _insertion_sort(K, V, start, end)
+    mid = (start + end) // 2
+    K[m], K[mid] = K[mid], K[m]
+    if V is not None:
+      V[m], V[mid] = V[mid], V[m]
+    m += 1
+  return select_in_place(K, V, lo, m - 1, (lo + m - 1) // 2)
+
+
+def select_in_place(K, V, lo, hi, i):
+  """
+  Rearrange K[lo:hi + 1] so that K[i] holds the element
+  which would be at index i if the range were sorted,
+  and return i. Partitions around median of medians
+  pivots, so unlike select in median.py this does not
+  copy any sublists and it allows duplicate keys
+
+  Complexity: O(n)
+
+  """
+  while hi - lo + 1 > 5:
+    lt, gt = three_way_partition(
+      K, V, lo, hi, median_of_medians(K, V, lo, hi))
+    if i < lt:
+      hi = lt - 1
+    elif i > gt:
+      lo = gt + 1
+    else:
+      return i
+  _insertion_sort(K, V, lo, hi)
+  return i
+
+
+def _deterministic_quicksort(K, V, lo, hi):
+  """
+  Sort K[lo:hi + 1] with quicksort using the median of
+  medians as the pivot, so each partition leaves at most
+  7 / 10 of the range on either side regardless of the input
+
+  Complexity: O(n * log(n)) in the worst case
+
+  """
+  while hi - lo + 1 > INSERTION_SORT_CUTOFF:
+    lt, gt = three_way_partition(
+      K, V, lo, hi, median_of_medians(K, V, lo, hi))
+    if lt - lo < hi - gt:
+      _deterministic_quicksort(K, V, lo, lt - 1)
+      lo = gt + 1
+    else:
+      _deterministic_quicksort(K, V, gt + 1, hi)
+      hi = lt - 1
+  _insertion_sort(K, V, lo, hi)
+
+
+def deterministic_quicksort(L, key=None):
+  """
+  Quicksort which is O(n * log(n)) even on inputs
+  crafted against its pivot choice, since the pivot
+  is found with the in-place median of medians
+
+  If key is given, the list is sorted by key(x)
+
+  """
+  if key is None:
+    _deterministic_quicksort(L, None, 0, len(L) - 1)
+  else:
+    _deterministic_quicksort([key(x) for x in L], L, 0, len(L) - 1)
+
+
+def _introsort(K, V, lo, hi, depth, fallback=_heapsort):
+  """
+  Sort K[lo:hi + 1] with quicksort, recursing only on the
+  smaller side of each partition and looping on the larger
+  one, so the stack is O(log(n)) deep. If the range has been
+  partitioned more than depth times, quicksort is making bad
+  choices for the pivot, so it switches to the fallback sort
+
+  """
+  while hi - lo + 1 > INSERTION_SORT_CUTOFF:
+    if depth == 0:
+      fallback(K, V, lo, hi)
+      return
+    depth -= 1
+    lt, gt = three_way_partition(K, V, lo, hi, _choose_pivot(K, lo, hi))
+    if lt - lo < hi - gt:
+      _introsort(K, V, lo, lt - 1, depth, fallback)
+      lo = gt + 1
+    else:
+      _introsort(K, V, gt + 1, hi, depth, fallback)
+      hi = lt - 1
+  _insertion_sort(K, V, lo, hi)
+
+
+def introsort(L, key=None, deterministic=False):
+  """
+  Introsort, the hybrid quicksort used by most standard
+  libraries. It sorts L in place and combines:
+
+  - median-of-three (or ninther) pivots
+  - 3-way partitioning so duplicates are handled once
+  - insertion sort for short ranges
+  - looping on the larger side of each partition
+  - heapsort when the recursion gets too deep
+
+  If key is given, the list is sorted by key(x) and key
+  is called once for each element. The sort is not stable
+
+  If deterministic is True, the fallback is the median of
+  medians quicksort above instead of heapsort
+
+  Complexity: O(n * log(n)) in the worst case
+
+  """
+  n = len(L)
+  if n < 2:
+    return
+  depth = 2 * int(log(n, 2))
+  fallback = _deterministic_quicksort if deterministic else _heapsort
+  if key is None:
+    _introsort(L, None, 0, n - 1, depth, fallback)
+  else:
+    _introsort([key(x) for x in L], L, 0, n - 1, depth, fallback)
+
+
+def benchmark(n=2000):
+  """
+  Time introsort, the deterministic quicksort,
+  and the 3 quicksorts above
+  on lists of length n which are random, sorted,
+  reversed, and have many duplicate elements
+
+  """
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * n))
+  inputs = [
+    ('random', [randint(0, n) for _ in range(n)]),
+    ('sorted', list(range(n))),
+    ('reversed', list(range(n, 0, -1))),
+    ('duplicates', [randint(0, 9) for _ in range(n)]),
+  ]
+  sorts = [
+    ('introsort', introsort),
+    ('deterministic_quicksort', deterministic_quicksort),
+    ('basic_quicksort', lambda L: basic_quicksort(L, 0, len(L) - 1)),
+    ('intelligent_quicksort',
+      lambda L: intelligent_quicksort(L, 0, len(L) - 1)),
+    ('random_quicksort', lambda L: random_quicksort(L, 0, len(L) - 1)),
+  ]
+  for name, sort in sorts:
+    for input_name, data in inputs:
+      L = list(data)
+      start = time()
+      try:
+        sort(L)
+        result = '{:.4f}s'.format(time() - start)
+      except Exception as e:
+        result = 'failed ({})'.format(type(e).__name__)
+      if result[-1] == 's' and L != sorted(data):
+        result = 'incorrect'
+      print('{:<24}{:<12}{}'.format(name, input_name, result))
+
+
+if __name__ == '__main__':
+  benchmark()
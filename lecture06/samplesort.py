@@ -0,0 +1,153 @@
+"""
+Lecture 6: Randomization
+Parallel Sample Sort
+--------------------
+Sample sort generalizes quicksort's partition step
+from one pivot to p - 1 pivots, called splitters, which
+divide the input into p buckets. Each bucket can then be
+sorted independently, so the buckets are sorted in parallel
+by a pool of p worker processes.
+
+The splitters are chosen by sampling the input and
+selecting evenly spaced ranks of the sample with the
+median finding algorithm from lecture 2. With enough
+samples per bucket the buckets have close to n / p
+elements each with high probability.
+
+The buckets are written to a shared memory array at
+their final offsets, so the workers sort them in place
+and the sorted result needs no concatenation step.
+
+"""
+
+
+from bisect import bisect_right
+from math import log
+from multiprocessing import Pool, RawArray, cpu_count
+from random import random, sample
+from time import time
+
+from median import select
+from quicksort import _heapsort, _introsort
+
+
+# View of the shared memory array each worker process sorts its buckets in
+_shared = None
+
+
+def _init_worker(shared, typecode):
+  """
+  Store a memoryview of the shared array in the worker process,
+  indexing a memoryview is much faster than indexing the ctypes
+  array itself and it still reads and writes shared memory
+
+  """
+  global _shared
+  _shared = memoryview(shared).cast('B').cast(typecode)
+
+
+def _sort_bucket(lo, hi):
+  """
+  Sort the bucket stored at shared[lo:hi] in place with
+  introsort, which only indexes the array, so the bucket
+  is never copied out of shared memory
+
+  """
+  depth = 2 * int(log(hi - lo, 2))
+  _introsort(_shared, None, lo, hi - 1, depth, _heapsort)
+
+
+def choose_splitters(L, p, oversample=64):
+  """
+  Choose up to p - 1 splitters for L by drawing
+  p * oversample samples and selecting the elements
+  of rank i * (sample size / p) for i = 1, ..., p - 1
+
+  Equal splitters are merged, which leaves fewer
+  splitters if L has few distinct elements
+
+  Complexity: O(p ** 2 * oversample)
+
+  """
+  S = sample(L, min(len(L), p * oversample))
+  step = len(S) / float(p)
+  splitters = [select(S, int(step * i)) for i in range(1, p)]
+  return sorted(set(splitters))
+
+
+def sample_sort(L, processes=None, oversample=64, typecode='d'):
+  """
+  Sort the numbers in L using a pool of worker processes
+  and return the result as a shared memory array with the
+  given array typecode ('d' for floats, 'q' for 64-bit ints)
+
+  Each element's bucket is found with a binary search of
+  the splitters in a single pass over L, then the elements
+  are scattered into the shared array so each bucket is
+  contiguous and starts at its final offset
+
+  Complexity: O((n / p) * log(n)) time per worker with high probability
+
+  """
+  n = len(L)
+  p = processes or cpu_count()
+  result = RawArray(typecode, n)
+  if n == 0:
+    return result
+  splitters = choose_splitters(L, p, oversample)
+  buckets = [bisect_right(splitters, x) for x in L]
+  offsets = [0] * (len(splitters) + 2)
+  for b in buckets:
+    offsets[b + 1] += 1
+  for b in range(1, len(offsets)):
+    offsets[b] += offsets[b - 1]
+  ends = offsets[:-1]
+  for x, b in zip(L, buckets):
+    result[ends[b]] = x
+    ends[b] += 1
+  ranges = [
+    (offsets[b], offsets[b + 1])
+    for b in range(len(offsets) - 1)
+    if offsets[b + 1] - offsets[b] > 1
+  ]
+  if p == 1:
+    _init_worker(result, typecode)
+    for lo, hi in ranges:
+      _sort_bucket(lo, hi)
+    return result
+  pool = Pool(p, initializer=_init_worker, initargs=(result, typecode))
+  try:
+    pool.starmap(_sort_bucket, ranges)
+  finally:
+    pool.close()
+    pool.join()
+  return result
+
+
+def benchmark(n=10 ** 6):
+  """
+  Time sample sort on n random floats using 1 up to
+  cpu_count() processes and print the speedup over
+  a single process
+
+  """
+  L = [random() for _ in range(n)]
+  expected = sorted(L)
+  base = None
+  p = 1
+  while True:
+    start = time()
+    result = sample_sort(L, processes=p)
+    elapsed = time() - start
+    base = base or elapsed
+    if list(result) != expected:
+      raise Exception('sample sort returned an unsorted array')
+    print('{} processes: {:.2f}s, speedup {:.2f}'.format(
+      p, elapsed, base / elapsed))
+    if p == cpu_count():
+      break
+    p = min(2 * p, cpu_count())
+
+
+if __name__ == '__main__':
+  benchmark()
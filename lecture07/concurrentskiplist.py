@@ -0,0 +1,319 @@
+"""
+Lecture 7: Randomization
+Concurrent Skip List
+--------------------
+A thread-safe version of the skip list in skiplist.py, based on
+the lazy skip list from "A Simple Optimistic Skiplist Algorithm"
+by Herlihy, Lev, Luchangco, and Shavit:
+
+http://people.csail.mit.edu/shanir/publications/LazySkipList.pdf
+
+Reads take no locks. Each forward pointer is a single list
+item which is replaced in one assignment, which is atomic
+under the GIL, so a reader always sees either the old or
+the new node on each level.
+
+Writers lock only the nodes whose pointers they change.
+An insert finds the predecessors of the new key on each
+level without locking, then locks them bottom-up and
+validates that nothing changed in between, retrying if
+it did. A delete first marks the node as logically deleted
+so readers stop returning it, then locks its predecessors
+and unlinks it from each level.
+
+"""
+
+
+from random import randint, random
+from threading import Lock, Thread
+from time import sleep
+
+from skiplist import random_level
+
+
+class ConcurrentListNode(object):
+  """
+  Skip-list node with a lock, a mark for
+  logical deletion, and a flag which is set
+  once the node is linked into every level
+
+  """
+  __slots__ = (
+    'key', 'value', 'forward', 'lock', 'marked', 'fully_linked')
+
+  def __init__(self, key, value, level):
+    self.key = key
+    self.value = value
+    self.forward = [None] * level
+    self.lock = Lock()
+    self.marked = False
+    self.fully_linked = False
+
+
+class ConcurrentSkipList(object):
+  """
+  Thread-safe skip list implementation of an ordered map
+
+  insert and delete return True if they changed the list,
+  so concurrent writers can tell whose write succeeded
+
+  """
+  def __init__(self, p=0.5, max_level=32):
+    self.p = p
+    self.max_level = max_level
+    self.head = ConcurrentListNode(None, None, max_level)
+    self.head.fully_linked = True
+    self.size = 0
+    self._size_lock = Lock()
+
+  def __len__(self):
+    return self.size
+
+  def __contains__(self, key):
+    return self.search(key)
+
+  def _add_to_size(self, n):
+    with self._size_lock:
+      self.size += n
+
+  def _find(self, key, preds, succs):
+    """
+    Fill preds and succs with the nodes before and
+    after key on each level without taking any locks,
+    and return the highest level the key was found on
+    or -1 if it was not found
+
+    """
+    found = -1
+    pred = self.head
+    for i in range(self.max_level - 1, -1, -1):
+      curr = pred.forward[i]
+      while curr is not None and curr.key < key:
+        pred = curr
+        curr = pred.forward[i]
+      if found == -1 and curr is not None and curr.key == key:
+        found = i
+      preds[i] = pred
+      succs[i] = curr
+    return found
+
+  @staticmethod
+  def _lock_preds(preds, level, locked):
+    """
+    Lock the distinct predecessors on levels 0 to level - 1,
+    bottom-up, appending each to locked. Every writer locks in
+    this order (right to left in the list) so they cannot deadlock
+
+    The same node can be the predecessor on several consecutive
+    levels but it is only locked once
+
+    """
+    prev = None
+    for i in range(level):
+      pred = preds[i]
+      if pred is not prev:
+        pred.lock.acquire()
+        locked.append(pred)
+        prev = pred
+
+  def insert(self, key, value=None):
+    """
+    Insert a key into the list, if the key is
+    already in the list its value is replaced
+    and this returns False
+
+    Complexity: O(log(N)) with high probability, without contention
+
+    """
+    level = random_level(self.p, self.max_level)
+    preds = [None] * self.max_level
+    succs = [None] * self.max_level
+    while True:
+      found = self._find(key, preds, succs)
+      if found != -1:
+        node = succs[found]
+        if not node.marked:
+          while not node.fully_linked:  # another insert is still linking it
+            sleep(0)  # yield the GIL to the linking thread
+          node.value = value
+          return False
+        sleep(0)  # the node is being deleted, wait for it to be unlinked
+        continue
+      locked = []
+      try:
+        self._lock_preds(preds, level, locked)
+        valid = all(
+          not preds[i].marked
+          and (succs[i] is None or not succs[i].marked)
+          and preds[i].forward[i] is succs[i]
+          for i in range(level))
+        if not valid:
+          continue
+        node = ConcurrentListNode(key, value, level)
+        for i in range(level):
+          node.forward[i] = succs[i]
+        for i in range(level):
+          preds[i].forward[i] = node
+        node.fully_linked = True
+      finally:
+        for pred in locked:
+          pred.lock.release()
+      self._add_to_size(1)
+      return True
+
+  def delete(self, key):
+    """
+    Delete a key from the list, returns False
+    if the key was not in the list
+
+    Complexity: O(log(N)) with high probability, without contention
+
+    """
+    preds = [None] * self.max_level
+    succs = [None] * self.max_level
+    victim = None
+    while True:
+      found = self._find(key, preds, succs)
+      if victim is None:
+        if found == -1:
+          return False
+        victim = succs[found]
+        if not victim.fully_linked \
+          or victim.marked \
+          or len(victim.forward) - 1 != found:
+            # not found on its top level yet, or someone else deleted it
+            return False
+        with victim.lock:
+          if victim.marked:
+            return False
+          victim.marked = True  # logical delete, readers ignore it from now on
+      locked = []
+      try:
+        self._lock_preds(preds, len(victim.forward), locked)
+        valid = all(
+          not preds[i].marked and preds[i].forward[i] is victim
+          for i in range(len(victim.forward)))
+        if not valid:
+          continue
+        for i in range(len(victim.forward) - 1, -1, -1):
+          preds[i].forward[i] = victim.forward[i]
+      finally:
+        for pred in locked:
+          pred.lock.release()
+      self._add_to_size(-1)
+      return True
+
+  def _lower_bound(self, key):
+    """
+    Return the first node whose key is >= key
+    or None if there is no such node, without locking
+
+    """
+    pred = self.head
+    for i in range(self.max_level - 1, -1, -1):
+      curr = pred.forward[i]
+      while curr is not None and curr.key < key:
+        pred = curr
+        curr = pred.forward[i]
+    return pred.forward[0]
+
+  def search(self, key):
+    """
+    Return True if the key is in the list,
+    this never blocks
+
+    Complexity: O(log(N)) with high probability
+
+    """
+    node = self._lower_bound(key)
+    return node is not None and node.key == key \
+      and node.fully_linked and not node.marked
+
+  def get(self, key, default=None):
+    """
+    Return the value stored at key, or default
+    if the key is not in the list, this never blocks
+
+    """
+    node = self._lower_bound(key)
+    if node is None or node.key != key \
+      or not node.fully_linked or node.marked:
+        return default
+    return node.value
+
+  def range(self, lo=None, hi=None):
+    """
+    Lazily yield the (key, value) pairs such that lo <= key <= hi
+    in ascending order, skipping deleted nodes. The iteration is
+    weakly consistent: it reflects some of the writes made while
+    it is running
+
+    """
+    node = self.head.forward[0] if lo is None else self._lower_bound(lo)
+    while node is not None and (hi is None or node.key <= hi):
+      if node.fully_linked and not node.marked:
+        yield node.key, node.value
+      node = node.forward[0]
+
+
+def _run_stress(s, readers, writers, duration, key_space):
+  """
+  Run readers and writers threads against s for duration
+  seconds and return the number of reads and writes done
+
+  """
+  counts = [0] * (readers + writers)
+  stop = [False]
+
+  def read(t):
+    n = 0
+    while not stop[0]:
+      s.search(randint(0, key_space))
+      n += 1
+    counts[t] = n
+
+  def write(t):
+    n = 0
+    while not stop[0]:
+      key = randint(0, key_space)
+      if random() < 0.5:
+        s.insert(key)
+      else:
+        s.delete(key)
+      n += 1
+    counts[t] = n
+
+  threads = [Thread(target=read, args=(t,)) for t in range(readers)]
+  threads += [
+    Thread(target=write, args=(readers + t,)) for t in range(writers)]
+  for thread in threads:
+    thread.start()
+  sleep(duration)
+  stop[0] = True
+  for thread in threads:
+    thread.join()
+  return sum(counts[:readers]), sum(counts[readers:])
+
+
+def benchmark(thread_counts=(1, 2, 4, 8), duration=2.0, key_space=10 ** 5):
+  """
+  Stress test the list with every combination of reader
+  and writer thread counts and print the throughput of
+  each, then check that the list is still consistent
+
+  """
+  s = ConcurrentSkipList()
+  for key in range(0, key_space, 2):
+    s.insert(key)
+  for readers in thread_counts:
+    for writers in thread_counts:
+      reads, writes = _run_stress(s, readers, writers, duration, key_space)
+      print('{} readers, {} writers: {:.0f} reads/s, {:.0f} writes/s'.format(
+        readers, writers, reads / duration, writes / duration))
+  keys = [key for key, _ in s.range()]
+  if keys != sorted(set(keys)) or len(keys) != len(s):
+    raise Exception('concurrent skip list is inconsistent')
+
+
+if __name__ == '__main__':
+  benchmark()
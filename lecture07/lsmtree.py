@@ -0,0 +1,619 @@
+"""
+Lecture 7: Randomization
+LSM-Tree Key-Value Store
+------------------------
+A log-structured merge-tree (LSM-tree) is a key-value store
+optimized for writes. Every write goes to an append-only
+write-ahead log (WAL) on disk, so it survives a crash, and to
+an in-memory sorted table, the memtable, which here is the
+skip list from skiplist.py.
+
+When the memtable is full it is written to disk as an immutable
+sorted run, called an SSTable (sorted string table), and a new
+memtable is started. Writes never modify a file in place, they
+only append, which makes them fast.
+
+A read checks the memtable and then each run from newest to
+oldest. To keep reads cheap:
+
+- each run has a sparse index with the first key and offset of
+  every block of records, so a lookup reads a single block
+- each run has a Bloom filter, a bit array which can tell that a
+  key is not in the run without reading the run at all
+- a background thread merges runs into one with a k-way merge
+  once there are too many of them (compaction), dropping
+  overwritten values and deleted keys
+
+Compaction is size-tiered: only adjacent runs of similar size
+are merged, so a run of N records grows by a constant factor
+each time it is rewritten and each record is rewritten
+O(log(N / memtable_size)) times, instead of the whole store
+being rewritten by every compaction.
+
+Keys are strings and values can be anything JSON can encode
+except None, which marks deleted keys (tombstones).
+
+"""
+
+
+from bisect import bisect_right
+from hashlib import blake2b
+from heapq import merge
+from random import randint
+from tempfile import mkdtemp
+from threading import Condition, Lock, Thread
+from time import time
+import json
+import os
+import shutil
+import struct
+
+from skiplist import SkipList
+
+
+# Value stored for deleted keys
+TOMBSTONE = None
+
+# Returned by lookups when a key is not found
+_MISSING = object()
+
+WAL_NAME = 'wal.log'
+SSTABLE_SUFFIX = '.sst'
+
+
+class BloomFilter(object):
+  """
+  Bloom filter with k hash functions over m bits. A key
+  which was added is always reported as present, a key
+  which was not added is reported as present with
+  probability about (1 - e ** (-k * n / m)) ** k
+
+  The k bit positions come from a single 128-bit hash
+  using double hashing: g_i(key) = h1(key) + i * h2(key)
+
+  """
+  def __init__(self, m, k, bits=None):
+    self.m = m
+    self.k = k
+    self.bits = bytearray((m + 7) // 8) if bits is None else bits
+
+  @staticmethod
+  def for_keys(n, bits_per_key=10):
+    """
+    Create an empty filter sized for n keys, with the
+    optimal number of hash functions for bits_per_key
+
+    """
+    return BloomFilter(
+      max(64, n * bits_per_key), max(1, int(round(bits_per_key * 0.69))))
+
+  @staticmethod
+  def _hash(key):
+    digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return (
+      int.from_bytes(digest[:8], 'little'),
+      int.from_bytes(digest[8:], 'little') | 1,
+    )
+
+  def add(self, key):
+    h1, h2 = BloomFilter._hash(key)
+    for i in range(self.k):
+      b = (h1 + i * h2) % self.m
+      self.bits[b >> 3] |= 1 << (b & 7)
+
+  def __contains__(self, key):
+    h1, h2 = BloomFilter._hash(key)
+    for i in range(self.k):
+      b = (h1 + i * h2) % self.m
+      if not self.bits[b >> 3] & (1 << (b & 7)):
+        return False
+    return True
+
+
+class SSTable(object):
+  """
+  An immutable sorted run on disk. The file holds one JSON
+  [key, value] record per line in key order, then a JSON
+  line of metadata (sequence number, sparse index, and Bloom
+  filter), then the 8-byte offset of the metadata line
+
+  seq orders the runs, a run with a larger seq is newer
+
+  """
+  def __init__(self, path):
+    self.path = path
+    self.name = os.path.basename(path)
+    self.fd = os.open(path, os.O_RDONLY)
+    end = os.fstat(self.fd).st_size - 8
+    meta_offset = struct.unpack('<Q', os.pread(self.fd, 8, end))[0]
+    meta = json.loads(
+      os.pread(self.fd, end - meta_offset, meta_offset).decode('utf-8'))
+    self.seq = meta['seq']
+    self.count = meta['count']
+    self.replaces = meta['replaces']
+    self.index_keys = [key for key, _ in meta['index']]
+    self.index_offsets = [offset for _, offset in meta['index']]
+    self.index_offsets.append(meta_offset)  # end of the last block
+    self.bloom = BloomFilter(
+      meta['bloom_m'], meta['bloom_k'], bytearray.fromhex(meta['bloom']))
+
+  @staticmethod
+  def write(path, items, seq, block_size=16, bits_per_key=10, replaces=()):
+    """
+    Write the sorted (key, value) pairs in items to a new
+    SSTable at path and return it. The file is written under
+    a temporary name and renamed once complete, so a crash
+    never leaves a partial run behind
+
+    """
+    keys = []
+    index = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      for key, value in items:
+        if len(keys) % block_size == 0:
+          index.append([key, f.tell()])
+        keys.append(key)
+        f.write(json.dumps([key, value]).encode('utf-8') + b'\n')
+      bloom = BloomFilter.for_keys(len(keys), bits_per_key)
+      for key in keys:
+        bloom.add(key)
+      meta_offset = f.tell()
+      f.write(json.dumps({
+        'seq': seq,
+        'count': len(keys),
+        'replaces': list(replaces),
+        'index': index,
+        'bloom_m': bloom.m,
+        'bloom_k': bloom.k,
+        'bloom': bloom.bits.hex(),
+      }).encode('utf-8'))
+      f.write(struct.pack('<Q', meta_offset))
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return SSTable(path)
+
+  def get(self, key, stats):
+    """
+    Return the value stored at key in this run, TOMBSTONE if
+    the key was deleted, or _MISSING if the run has no record
+    for the key. Reads at most one block from disk
+
+    """
+    if key not in self.bloom:
+      stats['bloom_negatives'] += 1
+      return _MISSING
+    i = bisect_right(self.index_keys, key) - 1
+    if i < 0:
+      return _MISSING
+    start, end = self.index_offsets[i], self.index_offsets[i + 1]
+    stats['blocks_read'] += 1
+    for line in os.pread(self.fd, end - start, start).splitlines():
+      record_key, value = json.loads(line.decode('utf-8'))
+      if record_key == key:
+        return value
+      if record_key > key:
+        break
+    return _MISSING
+
+  def items(self, lo=None):
+    """
+    Return an iterator over the (key, value) records in
+    the run starting from the first key >= lo. The file
+    is opened immediately, so the iterator keeps working
+    after the run is compacted and its file is deleted
+
+    """
+    i = 0 if lo is None else max(bisect_right(self.index_keys, lo) - 1, 0)
+    f = open(self.path, 'rb')
+    f.seek(self.index_offsets[i] if self.index_keys else 0)
+    end = self.index_offsets[-1]
+
+    def records():
+      with f:
+        while f.tell() < end:
+          key, value = json.loads(f.readline().decode('utf-8'))
+          if lo is None or key >= lo:
+            yield key, value
+
+    return records()
+
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+
+  def __del__(self):
+    if hasattr(self, 'fd'):  # the constructor may have failed to open it
+      self.close()
+
+
+def _tag(source, age):
+  """
+  Turn (key, value) pairs into (key, age, value) triples
+  so the merge orders records with equal keys by age
+
+  """
+  for key, value in source:
+    yield key, age, value
+
+
+def _newest_first(sources):
+  """
+  k-way merge of sorted (key, value) iterators, where
+  sources[0] is the newest, yielding only the newest
+  record for each key
+
+  """
+  tagged = [_tag(source, age) for age, source in enumerate(sources)]
+  last = _MISSING
+  for key, _, value in merge(*tagged):
+    if key != last:
+      last = key
+      yield key, value
+
+
+class LSMTree(object):
+  """
+  LSM-tree key-value store in a directory on disk
+
+  memtable_size: number of keys in the memtable before it is flushed
+  block_size: number of records per block of the sparse index
+  bits_per_key: size of each run's Bloom filter
+  compaction_trigger: number of runs of similar size which starts
+    a compaction, at least 2
+  size_ratio: runs belong to the same tier while each is at most
+    size_ratio times larger than the largest newer run in it
+  background: if False, compactions run in the writing thread
+  sync: if True, fsync the WAL after every write
+
+  """
+  def __init__(self, directory, memtable_size=4096, block_size=16,
+               bits_per_key=10, compaction_trigger=4, size_ratio=2,
+               background=True, sync=False):
+    self.directory = directory
+    self.memtable_size = memtable_size
+    self.block_size = block_size
+    self.bits_per_key = bits_per_key
+    self.compaction_trigger = max(compaction_trigger, 2)
+    self.size_ratio = size_ratio
+    self.sync = sync
+    self.stats = {
+      'gets': 0, 'runs_probed': 0, 'bloom_negatives': 0, 'blocks_read': 0,
+      'flushes': 0, 'compactions': 0, 'records_written': 0,
+    }
+    self._lock = Lock()
+    self._compaction_lock = Lock()
+    self._runs_changed = Condition(self._lock)
+    self._closed = False
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self.runs = self._load_runs()
+    self._next_seq = 1 + max([run.seq for run in self.runs] + [0])
+    self._next_file = 1 + max(
+      [int(run.name[:-len(SSTABLE_SUFFIX)]) for run in self.runs] + [0])
+    self.memtable = SkipList()
+    self._replay_wal()
+    self.wal = open(os.path.join(directory, WAL_NAME), 'a')
+    self._compactor = None
+    if background:
+      self._compactor = Thread(target=self._compact_in_background)
+      self._compactor.daemon = True
+      self._compactor.start()
+
+  def _load_runs(self):
+    """
+    Open every SSTable in the directory, oldest first, deleting
+    leftover inputs of a compaction which crashed before it
+    could remove them
+
+    """
+    names = [
+      name for name in os.listdir(self.directory)
+      if name.endswith(SSTABLE_SUFFIX)
+    ]
+    runs = [SSTable(os.path.join(self.directory, name)) for name in names]
+    replaced = set(name for run in runs for name in run.replaces)
+    for run in runs:
+      if run.name in replaced:
+        run.close()
+        os.remove(run.path)
+    runs = [run for run in runs if run.name not in replaced]
+    runs.sort(key=lambda run: run.seq)
+    return runs
+
+  def _replay_wal(self):
+    """
+    Restore the memtable from the WAL after a restart
+
+    """
+    path = os.path.join(self.directory, WAL_NAME)
+    if not os.path.exists(path):
+      return
+    with open(path) as f:
+      for line in f:
+        try:
+          key, value = json.loads(line)
+        except ValueError:  # torn write at the end of the log
+          break
+        self.memtable.insert(key, value)
+
+  def _new_path(self):
+    """
+    Return a path for a new SSTable, assumes the lock is held.
+    File names are unique but do not determine the order of
+    the runs, their seq does
+
+    """
+    number = self._next_file
+    self._next_file += 1
+    return os.path.join(
+      self.directory, '{:08d}{}'.format(number, SSTABLE_SUFFIX))
+
+  def _write(self, key, value):
+    """
+    Append a write to the WAL then apply it to the memtable,
+    flushing the memtable if it is full
+
+    """
+    with self._lock:
+      if self._closed:
+        raise ValueError('LSMTree is closed')
+      self.wal.write(json.dumps([key, value]) + '\n')
+      self.wal.flush()
+      if self.sync:
+        os.fsync(self.wal.fileno())
+      self.memtable.insert(key, value)
+      full = len(self.memtable) >= self.memtable_size
+      if full:
+        self._flush()
+    if full and self._compactor is None:
+      self._compact_tier()
+
+  def _flush(self):
+    """
+    Write the memtable to a new run and start an empty
+    memtable and WAL, assumes the lock is held
+
+    """
+    if len(self.memtable) == 0:
+      return
+    seq = self._next_seq
+    self._next_seq += 1
+    self.runs.append(SSTable.write(
+      self._new_path(), self.memtable.range(), seq,
+      self.block_size, self.bits_per_key))
+    self.stats['records_written'] += len(self.memtable)
+    self.memtable = SkipList()
+    self.wal.close()
+    self.wal = open(os.path.join(self.directory, WAL_NAME), 'w')
+    self.stats['flushes'] += 1
+    self._runs_changed.notify()
+
+  def put(self, key, value):
+    """
+    Store value at key
+
+    """
+    if value is TOMBSTONE:
+      raise ValueError('None cannot be stored, use delete')
+    self._write(key, value)
+
+  def delete(self, key):
+    """
+    Delete key by writing a tombstone, the key and
+    its older values are removed during compaction
+
+    """
+    self._write(key, TOMBSTONE)
+
+  def get(self, key, default=None):
+    """
+    Return the value stored at key, or default if the
+    key is not in the store. Checks the memtable, then
+    each run from newest to oldest. Only the memtable is
+    read under the lock, the runs are read from a snapshot
+    of the run list so disk reads do not block writers
+
+    """
+    with self._lock:
+      self.stats['gets'] += 1
+      value = self.memtable.get(key, _MISSING)
+      runs = list(self.runs)
+    if value is _MISSING:
+      stats = {'runs_probed': 0, 'bloom_negatives': 0, 'blocks_read': 0}
+      for run in reversed(runs):
+        stats['runs_probed'] += 1
+        value = run.get(key, stats)
+        if value is not _MISSING:
+          break
+      with self._lock:
+        for name, count in stats.items():
+          self.stats[name] += count
+    if value is _MISSING or value is TOMBSTONE:
+      return default
+    return value
+
+  def items(self, lo=None, hi=None):
+    """
+    Lazily yield the (key, value) pairs with lo <= key <= hi
+    in ascending order by merging the memtable and every run
+
+    """
+    with self._lock:
+      sources = [list(self.memtable.range(lo, hi))]
+      sources += [run.items(lo) for run in reversed(self.runs)]
+    for key, value in _newest_first(sources):
+      if hi is not None and key > hi:
+        return
+      if value is not TOMBSTONE:
+        yield key, value
+
+  def flush(self):
+    """
+    Write the memtable to disk as a new run
+
+    """
+    with self._lock:
+      self._flush()
+
+  def _full_tier(self):
+    """
+    Split the runs into tiers of adjacent runs whose sizes are
+    within size_ratio of each other and return the newest tier
+    with at least compaction_trigger runs, oldest first, or an
+    empty list. Assumes the lock is held
+
+    """
+    tier = []
+    largest = 0
+    for run in reversed(self.runs):
+      if tier and run.count > self.size_ratio * largest:
+        if len(tier) >= self.compaction_trigger:
+          break
+        tier, largest = [], 0
+      tier.append(run)
+      largest = max(largest, run.count, 1)
+    if len(tier) < self.compaction_trigger:
+      return []
+    return tier[::-1]
+
+  def _merge_runs(self, inputs):
+    """
+    Replace adjacent runs with one run holding the newest value
+    of each key, assumes the compaction lock is held. Deleted
+    keys are only dropped when the oldest run is merged, before
+    that their tombstones still hide values in older runs
+
+    """
+    if len(inputs) < 2:
+      return
+    with self._lock:
+      path = self._new_path()
+      drop_tombstones = inputs[0] is self.runs[0]
+    records = (
+      (key, value)
+      for key, value in _newest_first(
+        [run.items() for run in reversed(inputs)])
+      if value is not TOMBSTONE or not drop_tombstones
+    )
+    output = SSTable.write(
+      path, records, max(run.seq for run in inputs),
+      self.block_size, self.bits_per_key,
+      [run.name for run in inputs])
+    with self._lock:
+      # runs flushed during the merge were appended after the inputs
+      i = self.runs.index(inputs[0])
+      self.runs = self.runs[:i] + [output] + self.runs[i + len(inputs):]
+      self.stats['compactions'] += 1
+      self.stats['records_written'] += output.count
+    for run in inputs:
+      # a get may still be reading the run from its snapshot, the
+      # file descriptor is closed when the last reference is dropped
+      os.remove(run.path)
+
+  def _compact_tier(self):
+    """
+    Merge the newest tier of runs which has at least
+    compaction_trigger runs, if there is one
+
+    """
+    with self._compaction_lock:
+      with self._lock:
+        inputs = self._full_tier()
+      self._merge_runs(inputs)
+
+  def compact(self):
+    """
+    Merge every run into one with a k-way merge, keeping
+    only the newest value of each key and dropping deleted
+    keys. Runs flushed while the merge is running are newer
+    than its output and are left alone. This rewrites the
+    whole store, automatic compactions only merge a tier
+
+    """
+    with self._compaction_lock:
+      with self._lock:
+        inputs = list(self.runs)
+      self._merge_runs(inputs)
+
+  def _compact_in_background(self):
+    """
+    Body of the compaction thread, waits until a
+    tier has enough runs then compacts it
+
+    """
+    while True:
+      with self._lock:
+        while not self._closed \
+          and not self._full_tier():
+            self._runs_changed.wait()
+        if self._closed:
+          return
+      self._compact_tier()
+
+  def close(self):
+    """
+    Flush the memtable, stop the compaction
+    thread, and close every file. Closing a
+    closed store does nothing
+
+    """
+    with self._lock:
+      if self._closed:
+        return
+      self._flush()
+      self._closed = True
+      self._runs_changed.notify()
+    if self._compactor is not None:
+      self._compactor.join()
+    with self._lock:
+      self.wal.close()
+      for run in self.runs:
+        run.close()
+
+
+def benchmark(n=10 ** 5, reads=10 ** 4):
+  """
+  Measure the write throughput and write amplification (records
+  written to disk per put) of n random puts with compactions
+  running in the writing thread, then the read amplification of
+  random gets (how many runs and blocks each get touches) before
+  and after a full compaction
+
+  """
+  directory = mkdtemp()
+  try:
+    store = LSMTree(directory, background=False)
+    keys = ['{:016x}'.format(randint(0, 1 << 62)) for _ in range(n)]
+    start = time()
+    for i, key in enumerate(keys):
+      store.put(key, i)
+    elapsed = time() - start
+    print('{} puts: {:.0f} writes/s, {:.2f} write amplification, '
+          '{} runs'.format(
+            n, n / elapsed, store.stats['records_written'] / float(n),
+            len(store.runs)))
+    for label in ('before compaction', 'after compaction'):
+      for stat in store.stats:
+        store.stats[stat] = 0
+      queries = [keys[randint(0, n - 1)] for _ in range(reads // 2)]
+      queries += ['{:016x}'.format(randint(0, 1 << 62)) for _ in range(reads // 2)]
+      start = time()
+      for key in queries:
+        store.get(key)
+      elapsed = time() - start
+      print('{}: {:.0f} reads/s, {:.2f} runs probed, '
+            '{:.2f} blocks read per get'.format(
+              label, reads / elapsed,
+              store.stats['runs_probed'] / float(reads),
+              store.stats['blocks_read'] / float(reads)))
+      store.compact()
+    store.close()
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  benchmark()
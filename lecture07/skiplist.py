@@ -5,104 +5,275 @@ Skip Lists
 Skip lists are a randomized linked-list like data structure
 that support search in logarithmic time with high probability.
 
+Each node is given a random level from a geometric distribution,
+a node is in level i + 1 with probability p given it is in level i,
+and it stores one forward pointer for each level it is in. The
+expected number of levels is O(log(N)), and every operation starts
+at the top level of the head node and moves right until the next
+node is too far, then drops down a level. The expected number of
+steps on each level is 1 / p, so search, insert, and delete all take
+O(log(N)) time with high probability.
+
 """
 
 
-from random import getrandbits
+from random import random, randint
+from time import time
+import sys
+
+
+def random_level(p, max_level):
+  """
+  Draw a level for a new node, each extra level
+  is added with probability p, up to max_level
+
+  """
+  level = 1
+  while level < max_level and random() < p:
+    level += 1
+  return level
 
 
 class ListNode(object):
   """
-  Skip-list linked list node
+  Skip-list node, forward[i] is the next
+  node in level i of the list and width[i]
+  is how many level 0 steps that link skips
 
   """
-  def __init__(self, val):
-    self.val = val
-    self.next = None
-    self.up = None
-    self.down = None
+  __slots__ = ('key', 'value', 'forward', 'width')
+
+  def __init__(self, key, value, level):
+    self.key = key
+    self.value = value
+    self.forward = [None] * level
+    self.width = [1] * level
 
 
 class SkipList(object):
   """
-  Skip list implementation
+  Skip list implementation of an ordered map
+
+  Each link also stores its width, the number of
+  nodes it skips over in level 0, so the position
+  of a node is the sum of the widths of the links
+  followed to reach it. This lets the list compute
+  the rank of a key and select the key with a given
+  rank in O(log(N)) time with high probability, like
+  the order-statistic tree in lecture 9
+
+  p: probability of promoting a node to the next level
+  max_level: cap on the number of levels, the list stays
+    O(log(N)) for N up to about (1 / p) ** max_level
 
   """
-  def __init__(self):
-    self.levels = [ListNode(-float('inf'))]
-
-  def insert(self, val, level=0):
-    """
-    Insert into a skip list, promoting
-    elements to the higher levels using
-    a random coin flip
-
-    """
-    curr = self.levels[level]
-    node = ListNode(val)
-    while curr.next is not None:
-      curr = curr.next
-      if curr.next is not None \
-        and curr.next.val >= val:
-          break
-    if curr.next is None:
-      curr.next = node
-    else:
-      tmp = curr.next
-      curr.next = node
-      node.next = tmp
-    if getrandbits(1): # random coinflip determines if we insert at the next level
-      next_level = level + 1
-      if next_level == len(self.levels):
-        new_start = ListNode(-float('inf'))
-        self.levels[-1].up = new_start
-        new_start.down = self.levels[-1]
-        self.levels.append(new_start)
-      next_level_node = self.insert(val, next_level)
-      node.up = next_level_node
-      next_level_node.down = node
-    return node
-
-  def delete(self, val, level=0):
-    """
-    Delete a node from the skip list
-
-    """
-    curr = self.levels[level]
-    while curr.next is not None \
-      and curr.next.val != val:
-        curr = curr.next
-    if curr.next is None: # element not in the list
+  def __init__(self, p=0.5, max_level=32):
+    self.p = p
+    self.max_level = max_level
+    self.head = ListNode(None, None, max_level)
+    self.level = 1
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  def __contains__(self, key):
+    return self.search(key)
+
+  def __iter__(self):
+    return (key for key, _ in self.range())
+
+  def _find_update(self, key):
+    """
+    Descend from the top level and return the list of
+    update pointers, update[i] is the last node in level i
+    whose key is less than key, and the list of their
+    positions, where the head is at position 0
+
+    """
+    update = [self.head] * self.max_level
+    positions = [0] * self.max_level
+    node = self.head
+    pos = 0
+    for i in range(self.level - 1, -1, -1):
+      nxt = node.forward[i]
+      while nxt is not None and nxt.key < key:
+        pos += node.width[i]
+        node = nxt
+        nxt = node.forward[i]
+      update[i] = node
+      positions[i] = pos
+    return update, positions
+
+  def _lower_bound(self, key):
+    """
+    Return the first node whose key is >= key
+    or None if there is no such node
+
+    """
+    node = self.head
+    if key is None:
+      return node.forward[0]
+    for i in range(self.level - 1, -1, -1):
+      nxt = node.forward[i]
+      while nxt is not None and nxt.key < key:
+        node = nxt
+        nxt = node.forward[i]
+    return node.forward[0]
+
+  def insert(self, key, value=None):
+    """
+    Insert a key into a skip list, the new node is
+    spliced in after the update pointer on each
+    of its levels. If the key is already in the
+    list its value is replaced
+
+    Complexity: O(log(N)) with high probability
+
+    """
+    update, positions = self._find_update(key)
+    nxt = update[0].forward[0]
+    if nxt is not None and nxt.key == key:
+      nxt.value = value
       return
-    tmp = curr.next
-    curr.next = curr.next.next
-    if tmp.up is not None:
-      self.delete(val, level + 1)
+    level = random_level(self.p, self.max_level)
+    if level > self.level:
+      self.level = level
+    node = ListNode(key, value, level)
+    pos = positions[0] + 1
+    for i in range(level):
+      # the old link from update[i] is split in two around the new node
+      node.forward[i] = update[i].forward[i]
+      node.width[i] = update[i].width[i] - (pos - 1 - positions[i])
+      update[i].forward[i] = node
+      update[i].width[i] = pos - positions[i]
+    for i in range(level, self.level):
+      update[i].width[i] += 1
+    self.size += 1
 
-  @staticmethod
-  def search_list(val, node):
+  def delete(self, key):
     """
-    Static method searches a level of the list
-    for the value, if it does not find it it
-    recursively will check if the level below
-    contains the node, provided a level below exists
+    Delete a key from the skip list, does
+    nothing if the key is not in the list
+
+    Complexity: O(log(N)) with high probability
 
     """
-    while node.next is not None \
-      and node.next.val < val:
-        node = node.next
-    if node.next is not None \
-      and node.next.val == val:
-        return True
-    if node.down is None:
-      return False
-    return SkipList.search_list(val, node.down)
+    update, _ = self._find_update(key)
+    node = update[0].forward[0]
+    if node is None or node.key != key:  # element not in the list
+      return
+    for i in range(len(node.forward)):
+      update[i].forward[i] = node.forward[i]
+      update[i].width[i] += node.width[i] - 1
+    for i in range(len(node.forward), self.level):
+      update[i].width[i] -= 1
+    while self.level > 1 and self.head.forward[self.level - 1] is None:
+      self.level -= 1
+    self.size -= 1
+
+  def search(self, key):
+    """
+    Return True if the key is in the list
+
+    Complexity: O(log(N)) with high probability
 
-  def search(self, val):
     """
-    Instance method calls the static search
-    method defined above using the top level
-    as a starting point
+    node = self._lower_bound(key)
+    return node is not None and node.key == key
 
+  def get(self, key, default=None):
     """
-    return SkipList.search_list(val, self.levels[-1])
+    Return the value stored at key, or
+    default if the key is not in the list
+
+    Complexity: O(log(N)) with high probability
+
+    """
+    node = self._lower_bound(key)
+    if node is None or node.key != key:
+      return default
+    return node.value
+
+  def rank(self, key):
+    """
+    Return the number of keys in the list
+    less than key, the key does not need
+    to be in the list
+
+    Complexity: O(log(N)) with high probability
+
+    """
+    _, positions = self._find_update(key)
+    return positions[0]
+
+  def select(self, i):
+    """
+    Return the (key, value) pair with rank i
+
+    Complexity: O(log(N)) with high probability
+
+    """
+    if i < 0 or i >= self.size:
+      raise IndexError(
+        'Rank {} out of range'.format(i))
+    node = self.head
+    pos = 0
+    for level in range(self.level - 1, -1, -1):
+      while node.forward[level] is not None \
+        and pos + node.width[level] <= i + 1:
+          pos += node.width[level]
+          node = node.forward[level]
+    return node.key, node.value
+
+  def range(self, lo=None, hi=None):
+    """
+    Lazily yield the (key, value) pairs such that
+    lo <= key <= hi in ascending order. Either bound
+    can be None to leave that side of the range open
+
+    Complexity: O(log(N) + K) where K is the number of pairs yielded
+
+    """
+    node = self._lower_bound(lo)
+    while node is not None and (hi is None or node.key <= hi):
+      yield node.key, node.value
+      node = node.forward[0]
+
+  def iter_from(self, key):
+    """
+    Lazily yield the (key, value) pairs in
+    ascending order starting from the first
+    key which is >= key
+
+    """
+    return self.range(key)
+
+
+def benchmark(max_n=10 ** 7, queries=10 ** 5):
+  """
+  Insert random keys into a skip list and time
+  a batch of searches each time the list grows by
+  a factor of 10, up to max_n keys. The time per
+  search should grow with log(N)
+
+  """
+  s = SkipList()
+  n = 1000
+  while n <= max_n:
+    start = time()
+    while len(s) < n:
+      s.insert(randint(0, 1 << 62))
+    insert_time = time() - start
+    keys = [randint(0, 1 << 62) for _ in range(queries)]
+    start = time()
+    for key in keys:
+      s.search(key)
+    search_time = time() - start
+    print('N = {:>10}: {:.2f}s to insert, {:.2f}us per search'.format(
+      n, insert_time, 1e6 * search_time / queries))
+    n *= 10
+
+
+if __name__ == '__main__':
+  benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7)
@@ -0,0 +1,287 @@
+"""
+Lecture 8: Randomization
+Cuckoo Hashing
+--------------
+A cuckoo hash table gives each key d possible buckets,
+one from each of d independently drawn universal hash
+functions, and the key is always stored in one of them.
+A lookup only has to check those d buckets, so it takes
+O(1) time in the worst case, unlike chaining where a
+lookup walks a chain of unbounded length.
+
+To insert a key which has no free slot in any of its
+buckets, it evicts a key from one of them, which then
+moves to one of its other buckets, possibly evicting
+another key, and so on. Each bucket has several slots,
+which lets the table fill up to a high load factor
+before insertions start running into long eviction
+chains. If the chain goes on for too long, usually
+because of a cycle, the homeless key is put in a small
+stash which lookups also check. When the stash is full,
+the table draws new hash functions and rehashes.
+
+"""
+
+
+from random import choice, randint, randrange
+from time import perf_counter
+
+from universalhash import DotProductHashTable, MultiplyShiftHash
+
+
+# Marks an empty slot
+_EMPTY = object()
+
+
+class CuckooHashTable(object):
+  """
+  Bucketized cuckoo hash table with integer keys
+
+  Supports set, get, and delete
+
+  The table has m buckets of bucket_size slots each, stored
+  in two flat arrays of keys and values. It doubles when the
+  load factor goes above max_load and halves when it goes
+  below min_load, but never shrinks below its initial size
+
+  param: m {int} number of buckets, a power of 2 for MultiplyShiftHash
+  param: d {int} number of hash functions, and of buckets per key
+  param: bucket_size {int} slots per bucket
+  param: stash_size {int} keys which can wait in the stash
+  param: max_kicks {int} evictions before an insert gives up
+  param: hash_family {callable} draws a hash function for m buckets
+
+  """
+  def __init__(self, m=16, d=2, bucket_size=4, stash_size=4, max_kicks=500,
+               max_load=0.9, min_load=0.2, hash_family=MultiplyShiftHash):
+    self.d = d
+    self.bucket_size = bucket_size
+    self.stash_size = stash_size
+    self.max_kicks = max_kicks
+    self.max_load = max_load
+    self.min_load = min_load
+    self.hash_family = hash_family
+    self.min_size = m
+    self.count = 0
+    self._reset(m)
+
+  def __len__(self):
+    return self.count
+
+  def __contains__(self, key):
+    return self._find(key) != -1 or any(k == key for k, _ in self.stash)
+
+  def _reset(self, m):
+    """
+    Empty the table and give it m buckets
+    and d newly drawn hash functions
+
+    """
+    self.m = m
+    self.hashes = [self.hash_family(m) for _ in range(self.d)]
+    self.keys = [_EMPTY] * (m * self.bucket_size)
+    self.vals = [None] * (m * self.bucket_size)
+    self.stash = []
+
+  def items(self):
+    """
+    Yield every (key, val) pair in the table
+
+    """
+    for i, key in enumerate(self.keys):
+      if key is not _EMPTY:
+        yield key, self.vals[i]
+    for item in self.stash:
+      yield item
+
+  def _find(self, key):
+    """
+    Return the slot holding key, or -1 if it
+    is not in any of its buckets
+
+    Complexity: O(d * bucket_size)
+
+    """
+    for h in self.hashes:
+      start = h(key) * self.bucket_size
+      bucket = self.keys[start:start + self.bucket_size]
+      if key in bucket:
+        return start + bucket.index(key)
+    return -1
+
+  def _free_slot(self, key):
+    """
+    Return a free slot in one of the buckets
+    of key, or -1 if they are all full
+
+    """
+    for h in self.hashes:
+      start = h(key) * self.bucket_size
+      for i in range(start, start + self.bucket_size):
+        if self.keys[i] is _EMPTY:
+          return i
+    return -1
+
+  def _insert_new(self, key, val):
+    """
+    Store a key which is not in the table, evicting keys
+    into their other buckets if its buckets are full. If
+    the evictions go on for max_kicks steps, the key left
+    without a slot goes to the stash, and if the stash is
+    full it is returned so the caller can rehash
+
+    """
+    for _ in range(self.max_kicks):
+      i = self._free_slot(key)
+      if i != -1:
+        self.keys[i] = key
+        self.vals[i] = val
+        return None
+      # evict a random key from a random bucket of key
+      start = choice(self.hashes)(key) * self.bucket_size
+      i = start + randrange(self.bucket_size)
+      self.keys[i], key = key, self.keys[i]
+      self.vals[i], val = val, self.vals[i]
+    if len(self.stash) < self.stash_size:
+      self.stash.append((key, val))
+      return None
+    return key, val
+
+  def _rehash(self, m, extra=()):
+    """
+    Move every key, and the (key, val) pairs in extra,
+    into a new table with m buckets and new hash
+    functions, drawing again until every key fits and
+    doubling m after every few failed draws
+
+    Complexity: O(N + m) expected
+
+    """
+    items = list(self.items()) + list(extra)
+    attempts = 0
+    while True:
+      self._reset(m)
+      if all(self._insert_new(key, val) is None for key, val in items):
+        return
+      attempts += 1
+      if attempts % 4 == 0:
+        m *= 2
+
+  def set(self, key, val):
+    """
+    Sets a val to be stored at key,
+    if the key is already in the table
+    it will overwrite it
+
+    Complexity: O(1) amortized expected
+
+    """
+    i = self._find(key)
+    if i != -1:
+      self.vals[i] = val
+      return
+    for j, (k, _) in enumerate(self.stash):
+      if k == key:
+        self.stash[j] = (key, val)
+        return
+    homeless = self._insert_new(key, val)
+    if homeless is not None:
+      self._rehash(self.m, [homeless])
+    self.count += 1
+    if self.count > self.max_load * self.m * self.bucket_size:
+      self._rehash(2 * self.m)
+
+  def get(self, key):
+    """
+    Gets a value stored at the specified key,
+    if the key is not in the table, it will
+    return None
+
+    Complexity: O(d * bucket_size + stash_size) worst case
+
+    """
+    i = self._find(key)
+    if i != -1:
+      return self.vals[i]
+    for k, val in self.stash:
+      if k == key:
+        return val
+    return None
+
+  def delete(self, key):
+    """
+    Deletes the key and its value from the table,
+    raises a KeyError if the key is not in the table
+
+    Freeing a slot may make room for a key in the
+    stash, so the stash is moved back where possible
+
+    """
+    i = self._find(key)
+    if i != -1:
+      self.keys[i] = _EMPTY
+      self.vals[i] = None
+      stash = self.stash
+      self.stash = []
+      for k, val in stash:
+        j = self._free_slot(k)
+        if j == -1:
+          self.stash.append((k, val))
+        else:
+          self.keys[j] = k
+          self.vals[j] = val
+    else:
+      for j, (k, _) in enumerate(self.stash):
+        if k == key:
+          del self.stash[j]
+          break
+      else:
+        raise KeyError(
+          'key {} is not in the table'.format(key))
+    self.count -= 1
+    if self.m > self.min_size \
+      and self.count < self.min_load * self.m * self.bucket_size:
+        self._rehash(max(self.m // 2, self.min_size))
+
+
+def _lookup_latencies(get, keys):
+  """
+  Time each lookup in keys separately and
+  return the sorted latencies in microseconds
+
+  """
+  latencies = []
+  for key in keys:
+    start = perf_counter()
+    get(key)
+    latencies.append(1e6 * (perf_counter() - start))
+  latencies.sort()
+  return latencies
+
+
+def benchmark(n=10 ** 5, lookups=10 ** 5):
+  """
+  Fill a cuckoo table and a chained table with n random
+  keys, then time lookups of keys in the tables and print
+  the median, 99th percentile, and slowest lookup of each
+
+  """
+  keys = list(set(randint(0, (1 << 62) - 1) for _ in range(n)))
+  tables = [
+    ('cuckoo', CuckooHashTable()),
+    ('chaining', DotProductHashTable(
+      16, 8, hash_family=MultiplyShiftHash)),
+    ('chaining, dot product', DotProductHashTable(16, 8)),
+  ]
+  queries = [choice(keys) for _ in range(lookups)]
+  for name, table in tables:
+    for key in keys:
+      table.set(key, key)
+    latencies = _lookup_latencies(table.get, queries)
+    print('{:<22}p50 {:.2f}us, p99 {:.2f}us, max {:.2f}us'.format(
+      name, latencies[len(latencies) // 2],
+      latencies[int(0.99 * len(latencies))], latencies[-1]))
+
+
+if __name__ == '__main__':
+  benchmark()
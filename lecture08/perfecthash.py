@@ -7,14 +7,45 @@ described in the article:
 
 http://stevehanov.ca/blog/index.php?id=119
 
+There is also a table built with the compress, hash,
+and displace (CHD) algorithm from the paper "Hash, displace,
+and compress" by Belazzougui, Botelho, and Dietzfelbinger:
+
+http://cmph.sourceforge.net/papers/esa09.pdf
+
+It keeps its tables in typed arrays and can be saved to a
+file which is loaded in O(1) time by memory mapping it.
+
+For large key sets, the keys are split into shards
+whose CHD tables are built in parallel by worker processes
+and then concatenated into a single table.
+
+A perfect hash function maps keys which were never inserted
+to some arbitrary slot. Every table can also store a small
+fingerprint of the key in each slot, so lookups of other
+keys are rejected unless their fingerprint matches, which
+happens with probability 2 ** -fingerprint_bits.
+
 """
 
 
+from array import array
+from functools import lru_cache
+from hashlib import blake2b
+from multiprocessing import Pool, cpu_count
+from tempfile import mkdtemp
+from time import time
+import mmap
+import os
+import shutil
+import struct
 import sys
 
 
 DICTIONARY = '/usr/share/dict/words'
 
+MASK_64 = (1 << 64) - 1
+
 
 def load_dict():
   """
@@ -29,6 +60,29 @@ def load_dict():
   return D
 
 
+def fingerprint(key, bits):
+  """
+  Hash a string key to a fingerprint of the given
+  number of bits, independent of the hashes which
+  choose the key's slot
+
+  """
+  digest = blake2b(
+    key.encode('utf-8'), digest_size=2, person=b'fingerprint').digest()
+  return int.from_bytes(digest, 'little') & ((1 << bits) - 1)
+
+
+def _check_fingerprint_bits(bits):
+  """
+  Fingerprints are stored in an array('H'), and
+  fewer than 8 bits would reject too few keys
+
+  """
+  if bits != 0 and not 8 <= bits <= 16:
+    raise ValueError(
+      'fingerprint_bits must be 0 or from 8 to 16, not {}'.format(bits))
+
+
 class PerfectHashTable(object):
   @staticmethod
   def hash(d, key):
@@ -45,7 +99,7 @@ class PerfectHashTable(object):
       d = ((d * 0x01000193) ^ ord(c)) & 0xffffffff
     return d
 
-  def __init__(self, D):
+  def __init__(self, D, fingerprint_bits=0):
     """
     Create a perfect hash table using
     a given Python dictionary D
@@ -55,7 +109,11 @@ class PerfectHashTable(object):
     to find the key in the second table V which holds
     the value stored in the table
 
+    If fingerprint_bits is not 0, F holds a fingerprint
+    of the key stored in each slot of V
+
     """
+    _check_fingerprint_bits(fingerprint_bits)
     size = len(D)
     buckets = [[] for _ in range(size)]
     G = [0] * size
@@ -85,8 +143,6 @@ class PerfectHashTable(object):
       G[PerfectHashTable.hash(0, bucket[0]) % size] = d
       for k, b in enumerate(bucket):
         V[slots[k]] = D[b]
-      if (i % 1e3) == 0:
-        print 'bucket {}  finished'.format(i)
 
     # After going through all the buckets with length > 1, insert
     # the remaining values into the remaining slots through trial and
@@ -99,32 +155,521 @@ class PerfectHashTable(object):
       slot = freelist.pop()
       G[PerfectHashTable.hash(0, bucket[0]) % size] = -slot - 1
       V[slot] = D[bucket[0]]
-      if (i % 1e3) == 0:
-        print 'bucket {}  finished'.format(i)
 
     self.G = G
     self.V = V
     self.size = size
+    self.fingerprint_bits = fingerprint_bits
+    self.F = None
+    if fingerprint_bits:
+      self.F = array('H', [0]) * size
+      for key in D:
+        self.F[self._slot(key)] = fingerprint(key, fingerprint_bits)
 
-  def get(self, key):
+  def _slot(self, key):
     """
-    Get the value stored at key
+    Return the slot of V which key hashes to
 
     """
     d = self.G[PerfectHashTable.hash(0, key) % self.size]
     if d < 0:
-      return self.V[-d - 1]
-    return self.V[PerfectHashTable.hash(d, key) % self.size]
+      return -d - 1
+    return PerfectHashTable.hash(d, key) % self.size
+
+  def __contains__(self, key):
+    if self.F is None:
+      raise ValueError('the table was built without fingerprints')
+    return self.F[self._slot(key)] == fingerprint(key, self.fingerprint_bits)
+
+  def get(self, key):
+    """
+    Get the value stored at key, if the table has
+    fingerprints this returns None for keys which
+    were not in D, except for false positives
+
+    """
+    slot = self._slot(key)
+    if self.F is not None \
+      and self.F[slot] != fingerprint(key, self.fingerprint_bits):
+        return None
+    return self.V[slot]
+
+
+@lru_cache(maxsize=None)
+def _chd_hasher(seed):
+  """
+  Return a BLAKE2b object salted with seed which
+  chd_hash copies, since copying it is faster
+  than creating a new one for every key
+
+  """
+  return blake2b(digest_size=24, salt=seed.to_bytes(16, 'little'))
+
+
+def chd_hash(key, seed):
+  """
+  Hash a string key to three 64-bit integers
+  (g, f1, f2) with BLAKE2b, seed picks one
+  function from the family
+
+  """
+  h = _chd_hasher(seed).copy()
+  h.update(key.encode('utf-8'))
+  digest = int.from_bytes(h.digest(), 'little')
+  return digest & MASK_64, digest >> 64 & MASK_64, digest >> 128
+
+
+def chd_slot(key, seed, G, g_start, r, m):
+  """
+  Return the slot key hashes to in a CHD table with
+  r buckets, whose displacement indexes start at
+  G[g_start], and m slots
+
+  """
+  g, f1, f2 = chd_hash(key, seed)
+  d0, d1 = divmod(G[g_start + g % r], m)
+  return (f1 + d0 * f2 + d1) % m
+
+
+class CHDHashTable(object):
+  """
+  Perfect hash table built with compress, hash, and displace
+
+  Each key is hashed once to (g, f1, f2). g puts the key
+  in one of r buckets, and each bucket stores a single
+  integer, its displacement index idx = d0 * m + d1, in G.
+  The key is then stored at slot
+
+    (f1 + d0 * f2 + d1) % m
+
+  of the value table V, so a lookup is one hash and two
+  array reads. The buckets are placed largest first, and
+  each one tries displacements until all of its keys land
+  in free slots (see _place). Once only single-key buckets
+  are left, each is put straight into the next free slot
+  by solving for d1. If a bucket cannot be placed within
+  MAX_DISPLACEMENT_TRIES tries, e.g. because two of its
+  keys have the same (f1, f2), the build starts over with
+  the next seed
+
+  load: fraction of the m slots which hold a key, 1.0 makes
+    the table minimal but the last buckets need more tries
+  bucket_size: average number of keys per bucket, bigger
+    buckets make G smaller and the build slower
+
+  fingerprint_bits: bits of each key's fingerprint in F, or 0
+    for no fingerprints
+
+  The values in D must be integers which fit in 64 bits
+
+  Complexity: O(N) expected time to build
+
+  """
+  MAGIC = b'CHDHASH1'
+  MAX_DISPLACEMENT_TRIES = 4096
+  HEADER = struct.Struct('<8sQQQQQ')
+
+  def __init__(self, D, load=0.9, bucket_size=3, seed=0, fingerprint_bits=0):
+    _check_fingerprint_bits(fingerprint_bits)
+    n = len(D)
+    m = max(1, int(n / load))
+    r = max(1, (n + bucket_size - 1) // bucket_size)
+    while True:
+      built = self._build(D, m, r, seed)
+      if built is not None:
+        break
+      seed += 1  # some bucket could not be placed, draw new hash functions
+    G, slots = built
+    self.n = n
+    self.m = m
+    self.r = r
+    self.seed = seed
+    self.G = G
+    self.V = array('q', [0]) * m
+    for slot, value in zip(slots, D.values()):
+      self.V[slot] = value
+    self.fingerprint_bits = fingerprint_bits
+    self.F = None
+    if fingerprint_bits:
+      self.F = array('H', [0]) * m
+      for slot, key in zip(slots, D):
+        self.F[slot] = fingerprint(key, fingerprint_bits)
+
+  @staticmethod
+  def _place(bucket, taken, m):
+    """
+    Find a displacement index which puts every key of the
+    bucket in a free slot and return it with the keys'
+    slots, or None after MAX_DISPLACEMENT_TRIES tries
+
+    For each d0 the keys' offsets f1 + d0 * f2 are fixed,
+    so instead of trying every d1, bytearray.find jumps to
+    the next free slot for the first key and only those
+    d1 are checked against the rest of the keys. taken
+    holds every slot twice, at s and s + m, so the other
+    keys are checked without reducing mod m
+
+    """
+    tries = 0
+    for d0 in range((1 << 32) // m):
+      offsets = [(f1 + d0 * f2) % m for f1, f2, _ in bucket]
+      first = offsets[0]
+      deltas = [(offset - first) % m for offset in offsets[1:]]
+      if 0 in deltas or len(set(deltas)) < len(deltas):
+        tries += 1  # two keys share a slot for every d1
+      else:
+        for lo, hi in ((first, m), (0, first)):  # d1 = 0, 1, ..., m - 1
+          s = taken.find(0, lo, hi)
+          while s != -1:
+            tries += 1
+            for delta in deltas:
+              if taken[s + delta]:
+                break
+            else:
+              return (
+                d0 * m + (s - first) % m,
+                [s] + [(s + delta) % m for delta in deltas])
+            if tries >= CHDHashTable.MAX_DISPLACEMENT_TRIES:
+              return None
+            s = taken.find(0, s + 1, hi)
+      if tries >= CHDHashTable.MAX_DISPLACEMENT_TRIES:
+        return None
+    return None
+
+  @staticmethod
+  def _build(D, m, r, seed):
+    """
+    Compute the displacement index of every bucket and
+    the slot of every key, in the order of D, or return
+    None if some bucket cannot be placed
+
+    """
+    buckets = [[] for _ in range(r)]
+    for i, key in enumerate(D):
+      g, f1, f2 = chd_hash(key, seed)
+      buckets[g % r].append((f1 % m, f2 % m, i))
+    order = sorted(range(r), key=lambda b: len(buckets[b]), reverse=True)
+    G = array('I', [0]) * r
+    slots = array('Q', [0]) * len(D)
+    taken = bytearray(2 * m)  # a byte per slot, see _place
+
+    b = 0
+    while b < r and len(buckets[order[b]]) > 1:
+      bucket = buckets[order[b]]
+      placed = CHDHashTable._place(bucket, taken, m)
+      if placed is None:
+        return None
+      G[order[b]], bucket_slots = placed
+      for slot, (_, _, i) in zip(bucket_slots, bucket):
+        taken[slot] = taken[slot + m] = 1
+        slots[i] = slot
+      b += 1
+
+    s = -1
+    while b < r and len(buckets[order[b]]) == 1:
+      f1, _, i = buckets[order[b]][0]
+      s = taken.find(0, s + 1, m)
+      slots[i] = s
+      G[order[b]] = (s - f1) % m  # d0 = 0, so d1 moves it to the slot
+      b += 1
+    return G, slots
+
+  def _slot(self, key):
+    """
+    Return the slot of V which key hashes to
+
+    """
+    return chd_slot(key, self.seed, self.G, 0, self.r, self.m)
+
+  def __len__(self):
+    return self.n
+
+  def __contains__(self, key):
+    if self.F is None:
+      raise ValueError('the table was built without fingerprints')
+    return self.F[self._slot(key)] == fingerprint(key, self.fingerprint_bits)
+
+  def get(self, key):
+    """
+    Get the value stored at key, the result is arbitrary
+    if key was not in D, unless the table has fingerprints,
+    then it is None except for false positives
+
+    Complexity: O(1)
+
+    """
+    slot = self._slot(key)
+    if self.F is not None \
+      and self.F[slot] != fingerprint(key, self.fingerprint_bits):
+        return None
+    return self.V[slot]
+
+  def save(self, path):
+    """
+    Write the table to a file: a header, then G, V,
+    and F as raw arrays in the machine's byte order,
+    with V aligned to 8 bytes
+
+    """
+    with open(path, 'wb') as f:
+      f.write(self.HEADER.pack(
+        self.MAGIC, self.n, self.m, self.r, self.seed, self.fingerprint_bits))
+      f.write(self.G.tobytes())
+      f.write(b'\0' * (-f.tell() % 8))
+      f.write(self.V.tobytes())
+      if self.F is not None:
+        f.write(self.F.tobytes())
+
+  @staticmethod
+  def load(path):
+    """
+    Load a table saved with save by memory mapping the
+    file, G, V, and F are views of the mapped pages, so the
+    operating system only reads the pages lookups touch
+
+    Complexity: O(1)
+
+    """
+    with open(path, 'rb') as f:
+      buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, n, m, r, seed, bits = CHDHashTable.HEADER.unpack_from(buf)
+    if magic != CHDHashTable.MAGIC:
+      raise ValueError(
+        '{} is not a CHD hash table file'.format(path))
+    view = memoryview(buf)
+    start = CHDHashTable.HEADER.size
+    g_end = start + 4 * r
+    v_start = g_end + (-g_end % 8)
+    t = object.__new__(CHDHashTable)
+    v_end = v_start + 8 * m
+    t.n, t.m, t.r, t.seed, t.fingerprint_bits = n, m, r, seed, bits
+    t.G = view[start:g_end].cast('I')
+    t.V = view[v_start:v_end].cast('q')
+    t.F = view[v_end:v_end + 2 * m].cast('H') if bits else None
+    return t
+
+
+# Each key in a shard file is stored as its value, the
+# length of its UTF-8 encoding, then the encoded key
+RECORD = struct.Struct('<qI')
+
+
+def shard_of(key, shards):
+  """
+  First level hash which picks the shard of
+  a key, independent of the hashes in chd_hash
+
+  """
+  digest = blake2b(
+    key.encode('utf-8'), digest_size=8, person=b'shard').digest()
+  return int.from_bytes(digest, 'little') % shards
+
+
+def _build_shard(path, start, end, load, bucket_size, seed, fingerprint_bits):
+  """
+  Read the records in path[start:end] and build
+  a CHD table for them, returning its sizes and
+  its G, V, and F arrays as bytes
+
+  """
+  D = dict()
+  with open(path, 'rb') as f:
+    f.seek(start)
+    buf = f.read(end - start)
+  pos = 0
+  while pos < len(buf):
+    value, length = RECORD.unpack_from(buf, pos)
+    pos += RECORD.size
+    D[buf[pos:pos + length].decode('utf-8')] = value
+    pos += length
+  t = CHDHashTable(D, load, bucket_size, seed, fingerprint_bits)
+  F = t.F.tobytes() if t.F is not None else b''
+  return t.n, t.m, t.r, t.seed, t.G.tobytes(), t.V.tobytes(), F
+
+
+class ShardedHashTable(object):
+  """
+  Two level perfect hash table for key sets too big
+  to build one table for quickly
+
+  The first level hash splits the keys into shards.
+  The keys are written to a temporary file with each
+  shard's records in one contiguous range, and a pool
+  of worker processes each read a range and build a
+  CHDHashTable for that shard. The shards' G and V
+  arrays are concatenated, and g_offsets and v_offsets
+  hold where each shard starts, so a lookup hashes the
+  key to its shard then looks it up inside that shard's
+  part of the arrays
+
+  shards: number of shards, by default about 10 ** 5 keys each
+  processes: number of worker processes, cpu_count() by default
+  fingerprint_bits: bits of each key's fingerprint in F, or 0
+    for no fingerprints
+
+  Complexity: O(N / p) expected time per worker to build
+
+  """
+  def __init__(self, D, shards=None, processes=None,
+               load=0.9, bucket_size=3, seed=0, fingerprint_bits=0):
+    _check_fingerprint_bits(fingerprint_bits)
+    n = len(D)
+    shards = shards or max(1, n // 10 ** 5)
+    p = processes or cpu_count()
+    directory = mkdtemp()
+    try:
+      path = os.path.join(directory, 'keys.bin')
+      ranges = self._write_shards(path, D, shards)
+      tasks = [
+        (path, start, end, load, bucket_size, seed, fingerprint_bits)
+        for start, end in ranges]
+      if p == 1:
+        results = [_build_shard(*task) for task in tasks]
+      else:
+        pool = Pool(p)
+        try:
+          results = pool.starmap(_build_shard, tasks)
+        finally:
+          pool.close()
+          pool.join()
+    finally:
+      shutil.rmtree(directory)
+
+    self.n = n
+    self.shards = shards
+    self.g_offsets = array('Q', [0])
+    self.v_offsets = array('Q', [0])
+    self.seeds = array('Q')
+    self.G = array('I')
+    self.V = array('q')
+    self.fingerprint_bits = fingerprint_bits
+    self.F = array('H') if fingerprint_bits else None
+    for _, m, r, shard_seed, G, V, F in results:
+      self.g_offsets.append(self.g_offsets[-1] + r)
+      self.v_offsets.append(self.v_offsets[-1] + m)
+      self.seeds.append(shard_seed)
+      self.G.frombytes(G)
+      self.V.frombytes(V)
+      if self.F is not None:
+        self.F.frombytes(F)
+
+  @staticmethod
+  def _write_shards(path, D, shards):
+    """
+    Write the items of D to path grouped by shard and
+    return the (start, end) byte range of each shard
+
+    Each shard's records are buffered in memory and
+    written at the shard's offset when the buffer fills,
+    so memory stays bounded while the file is written
+
+    """
+    shard_ids = array('I')
+    sizes = [0] * shards
+    for key in D:
+      s = shard_of(key, shards)
+      shard_ids.append(s)
+      sizes[s] += RECORD.size + len(key.encode('utf-8'))
+    ends = [0] * shards
+    total = 0
+    for s in range(shards):
+      ends[s] = total
+      total += sizes[s]
+    ranges = [(ends[s], ends[s] + sizes[s]) for s in range(shards)]
+    buffers = [bytearray() for _ in range(shards)]
+    with open(path, 'wb') as f:
+      f.truncate(total)
+      fd = f.fileno()
+      for s, (key, value) in zip(shard_ids, D.items()):
+        encoded = key.encode('utf-8')
+        buffers[s] += RECORD.pack(value, len(encoded)) + encoded
+        if len(buffers[s]) >= 1 << 20:
+          os.pwrite(fd, buffers[s], ends[s])
+          ends[s] += len(buffers[s])
+          buffers[s] = bytearray()
+      for s in range(shards):
+        os.pwrite(fd, buffers[s], ends[s])
+    return ranges
+
+  def __len__(self):
+    return self.n
+
+  def _slot(self, key):
+    """
+    Return the slot of V which key hashes to,
+    inside the part of V which holds its shard
+
+    """
+    s = shard_of(key, self.shards)
+    g_start = self.g_offsets[s]
+    v_start = self.v_offsets[s]
+    return v_start + chd_slot(
+      key, self.seeds[s], self.G, g_start,
+      self.g_offsets[s + 1] - g_start, self.v_offsets[s + 1] - v_start)
+
+  def __contains__(self, key):
+    if self.F is None:
+      raise ValueError('the table was built without fingerprints')
+    return self.F[self._slot(key)] == fingerprint(key, self.fingerprint_bits)
+
+  def get(self, key):
+    """
+    Get the value stored at key, the result is arbitrary
+    if key was not in D, unless the table has fingerprints,
+    then it is None except for false positives
+
+    Complexity: O(1)
+
+    """
+    slot = self._slot(key)
+    if self.F is not None \
+      and self.F[slot] != fingerprint(key, self.fingerprint_bits):
+        return None
+    return self.V[slot]
+
+
+def benchmark(D):
+  """
+  Time building the tables over D, saving
+  and loading the CHD table, and building
+  the sharded table with 1 up to cpu_count()
+  worker processes
+
+  """
+  start = time()
+  PerfectHashTable(D)
+  print('PerfectHashTable built in {:.2f}s'.format(time() - start))
+  start = time()
+  t = CHDHashTable(D)
+  print('CHDHashTable built in {:.2f}s'.format(time() - start))
+  directory = mkdtemp()
+  try:
+    path = os.path.join(directory, 'chd.bin')
+    t.save(path)
+    start = time()
+    t = CHDHashTable.load(path)
+    print('CHDHashTable loaded in {:.6f}s'.format(time() - start))
+    if any(t.get(key) != value for key, value in D.items()):
+      raise Exception('CHD hash table returned a wrong value')
+  finally:
+    shutil.rmtree(directory)
+  for p in sorted(set([1, cpu_count()])):
+    start = time()
+    t = ShardedHashTable(D, shards=4 * cpu_count(), processes=p)
+    print('ShardedHashTable built in {:.2f}s with {} processes'.format(
+      time() - start, p))
+    if any(t.get(key) != value for key, value in D.items()):
+      raise Exception('sharded hash table returned a wrong value')
 
 
 if __name__ == '__main__':
-  print 'Reading words from OS'
+  print('Reading words from OS')
   D = load_dict()
-  print 'Creating hash table'
-  t = PerfectHashTable(D)
+  print('Creating hash table')
+  t = CHDHashTable(D, fingerprint_bits=16)
   for word in sys.argv[1:]:
     line = t.get(word)
-    print '{} is on line {}'.format(word, line)
-
-
-
+    if line is None:
+      print('{} is not in the dictionary'.format(word))
+    else:
+      print('{} is on line {}'.format(word, line))
@@ -0,0 +1,340 @@
+"""
+Lecture 8: Randomization
+Bloom Filters and Count-Min Sketches
+------------------------------------
+Two data structures which summarize a stream of integer
+keys in a fixed amount of memory, using the universal hash
+families in universalhash.py, at the cost of some error.
+
+A Bloom filter answers whether a key was added. It never
+says no for a key which was added, but it can say yes for a
+key which was not, with a false positive rate which depends
+on its size and the number of keys added.
+
+A count-min sketch estimates how many times each key was
+added. It never underestimates, and with probability
+1 - delta it overestimates by at most epsilon times the
+total count of all keys.
+
+Both can add and query a NumPy array of keys at once, can be
+merged with another one built with the same hash functions,
+for example by parallel workers, and can be serialized.
+
+"""
+
+
+from array import array
+from math import ceil, e, log
+import json
+
+import numpy as np
+
+from universalhash import HASH_FAMILIES, MultiplyShiftHash
+
+
+def _power_of_two(n):
+  """
+  Return the smallest power of 2 which is >= n
+
+  """
+  return 1 << max(0, (n - 1).bit_length())
+
+
+def _hash_state(h):
+  """
+  Return a JSON serializable description of a hash function
+
+  """
+  return {'family': type(h).__name__, 'params': h.params()}
+
+
+def _hash_from_state(state):
+  """
+  Rebuild a hash function from _hash_state
+
+  """
+  return HASH_FAMILIES[state['family']](**state['params'])
+
+
+def _split_header(data):
+  """
+  Split serialized bytes into the JSON header
+  on the first line and the raw storage after it
+
+  """
+  end = data.index(b'\n')
+  return json.loads(data[:end].decode('utf-8')), data[end + 1:]
+
+
+class PartitionedBloomFilter(object):
+  """
+  Bloom filter whose m bits are split into k partitions of
+  equal size, and each key sets one bit in each partition
+
+  The k bit positions come from two hash functions by
+  double hashing, so position i is (h1(key) + i * h2(key))
+  modulo the partition size, which only costs two hashes
+  per key. Partitioning keeps the k positions of a key
+  distinct, and the false positive rate is about
+
+    (1 - e ** (-n / (m / k))) ** k
+
+  after n keys are added
+
+  param: m {int} number of bits, rounded up so the partition
+    size is a power of 2
+  param: k {int} number of partitions, and of bits per key
+  param: hash_family {callable} draws a hash function for a partition
+  param: hashes {list} the two hash functions, drawn if not given
+
+  """
+  def __init__(self, m, k, hash_family=MultiplyShiftHash, hashes=None):
+    self.k = k
+    self.size = _power_of_two(max(8, -(-m // k)))  # bits per partition
+    self.m = self.size * k
+    self.hashes = hashes or [hash_family(self.size), hash_family(self.size)]
+    self.bits = bytearray(self.m // 8)
+
+  @staticmethod
+  def for_capacity(n, fp_rate, hash_family=MultiplyShiftHash):
+    """
+    Create a filter with the optimal number of bits and
+    partitions to hold n keys with the given false positive rate
+
+    """
+    k = max(1, int(ceil(log(1.0 / fp_rate, 2))))
+    m = int(ceil(n * k / log(2)))
+    return PartitionedBloomFilter(m, k, hash_family)
+
+  def _positions(self, key):
+    """
+    Return the bit position of key in each partition
+
+    """
+    h1 = self.hashes[0](key)
+    h2 = self.hashes[1](key)
+    mask = self.size - 1
+    return [i * self.size + ((h1 + i * h2) & mask) for i in range(self.k)]
+
+  def _positions_many(self, keys):
+    """
+    Return a k by len(keys) array of the
+    bit positions of each key
+
+    """
+    h1 = self.hashes[0].hash_many(keys)
+    h2 = self.hashes[1].hash_many(keys)
+    i = np.arange(self.k, dtype=np.int64)[:, np.newaxis]
+    return i * self.size + ((h1 + i * h2) & (self.size - 1))
+
+  def add(self, key):
+    """
+    Add a key to the filter
+
+    Complexity: O(k)
+
+    """
+    for p in self._positions(key):
+      self.bits[p >> 3] |= 1 << (p & 7)
+
+  def __contains__(self, key):
+    return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+  def add_many(self, keys):
+    """
+    Add every key in an integer array
+
+    """
+    p = self._positions_many(keys).ravel()
+    bits = np.frombuffer(self.bits, dtype=np.uint8)
+    np.bitwise_or.at(bits, p >> 3, (1 << (p & 7)).astype(np.uint8))
+
+  def contains_many(self, keys):
+    """
+    Return a boolean array, True where the
+    key in keys may have been added
+
+    """
+    p = self._positions_many(keys)
+    bits = np.frombuffer(self.bits, dtype=np.uint8)
+    return ((bits[p >> 3] >> (p & 7).astype(np.uint8)) & 1).all(axis=0)
+
+  def merge(self, other):
+    """
+    Add every key added to other into this filter. Both
+    filters must have the same size and hash functions,
+    e.g. by creating each worker's filter with
+    hashes=first.hashes
+
+    """
+    if self.m != other.m or self.k != other.k or \
+      list(map(_hash_state, self.hashes)) != list(map(_hash_state, other.hashes)):
+        raise ValueError('cannot merge Bloom filters with different hashes')
+    bits = np.frombuffer(self.bits, dtype=np.uint8)
+    bits |= np.frombuffer(other.bits, dtype=np.uint8)
+
+  def to_bytes(self):
+    """
+    Serialize the filter as a JSON header line
+    followed by the raw bits
+
+    """
+    header = {
+      'm': self.m,
+      'k': self.k,
+      'hashes': [_hash_state(h) for h in self.hashes],
+    }
+    return json.dumps(header).encode('utf-8') + b'\n' + bytes(self.bits)
+
+  @staticmethod
+  def from_bytes(data):
+    """
+    Rebuild a filter serialized with to_bytes
+
+    """
+    header, bits = _split_header(data)
+    f = PartitionedBloomFilter(
+      header['m'], header['k'],
+      hashes=[_hash_from_state(h) for h in header['hashes']])
+    f.bits = bytearray(bits)
+    return f
+
+
+class CountMinSketch(object):
+  """
+  Count-min sketch with depth rows of width counters,
+  each row has its own independently drawn hash function
+
+  Adding a key adds its count to the counter it hashes to
+  in every row, and the estimate of a key's count is the
+  smallest of its counters, since each counter also holds
+  the counts of the keys which collide with it. With
+  width = e / epsilon and depth = ln(1 / delta), the
+  estimate is at most epsilon * total too high with
+  probability 1 - delta
+
+  param: width {int} counters per row, rounded up to a power of 2
+  param: depth {int} number of rows
+  param: hash_family {callable} draws a hash function for a row
+  param: hashes {list} the depth hash functions, drawn if not given
+
+  """
+  def __init__(self, width, depth, hash_family=MultiplyShiftHash, hashes=None):
+    self.width = _power_of_two(width)
+    self.depth = depth
+    self.hashes = hashes or [hash_family(self.width) for _ in range(depth)]
+    self.counts = array('Q', [0]) * (self.width * depth)
+    self.total = 0
+
+  @staticmethod
+  def for_error(epsilon, delta, hash_family=MultiplyShiftHash):
+    """
+    Create a sketch whose estimates are at most epsilon
+    times the total count too high with probability 1 - delta
+
+    """
+    width = int(ceil(e / epsilon))
+    depth = max(1, int(ceil(log(1.0 / delta))))
+    return CountMinSketch(width, depth, hash_family)
+
+  def add(self, key, count=1):
+    """
+    Add count to the count of key
+
+    Complexity: O(depth)
+
+    """
+    for row, h in enumerate(self.hashes):
+      self.counts[row * self.width + h(key)] += count
+    self.total += count
+
+  def estimate(self, key):
+    """
+    Return an estimate of the count of key
+    which is never too low
+
+    Complexity: O(depth)
+
+    """
+    return min(
+      self.counts[row * self.width + h(key)]
+      for row, h in enumerate(self.hashes))
+
+  def _positions_many(self, keys):
+    """
+    Return a depth by len(keys) array of the
+    counter positions of each key
+
+    """
+    return np.array([
+      row * self.width + h.hash_many(keys)
+      for row, h in enumerate(self.hashes)
+    ], dtype=np.int64).reshape(self.depth, len(keys))
+
+  def add_many(self, keys, counts=None):
+    """
+    Add each count in counts, or 1 if counts is None,
+    to the count of the matching key in keys
+
+    """
+    p = self._positions_many(keys)
+    if counts is None:
+      counts = np.ones(len(keys), dtype=np.uint64)
+    else:
+      counts = np.asarray(counts).astype(np.uint64)
+    view = np.frombuffer(self.counts, dtype=np.uint64)
+    for row in range(self.depth):
+      np.add.at(view, p[row], counts)
+    self.total += int(counts.sum())
+
+  def estimate_many(self, keys):
+    """
+    Return an array of the estimated count of each key in keys
+
+    """
+    view = np.frombuffer(self.counts, dtype=np.uint64)
+    return view[self._positions_many(keys)].min(axis=0)
+
+  def merge(self, other):
+    """
+    Add the counts of other into this sketch. Both
+    sketches must have the same size and hash functions,
+    e.g. by creating each worker's sketch with
+    hashes=first.hashes
+
+    """
+    if self.width != other.width or self.depth != other.depth or \
+      list(map(_hash_state, self.hashes)) != list(map(_hash_state, other.hashes)):
+        raise ValueError('cannot merge count-min sketches with different hashes')
+    view = np.frombuffer(self.counts, dtype=np.uint64)
+    view += np.frombuffer(other.counts, dtype=np.uint64)
+    self.total += other.total
+
+  def to_bytes(self):
+    """
+    Serialize the sketch as a JSON header line
+    followed by the raw counters
+
+    """
+    header = {
+      'width': self.width,
+      'depth': self.depth,
+      'total': self.total,
+      'hashes': [_hash_state(h) for h in self.hashes],
+    }
+    return json.dumps(header).encode('utf-8') + b'\n' + self.counts.tobytes()
+
+  @staticmethod
+  def from_bytes(data):
+    """
+    Rebuild a sketch serialized with to_bytes
+
+    """
+    header, counts = _split_header(data)
+    s = CountMinSketch(
+      header['width'], header['depth'],
+      hashes=[_hash_from_state(h) for h in header['hashes']])
+    s.counts = array('Q')
+    s.counts.frombytes(counts)
+    s.total = header['total']
+    return s
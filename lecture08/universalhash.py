@@ -6,10 +6,220 @@ An implementation of a hash table with
 chaining which uses a universal hash
 function
 
+The table keeps its load factor (the number
+of keys divided by the number of slots) between
+two thresholds by doubling or halving its size.
+Each resize draws a new random hash function and
+rehashes every key, which takes O(N) time but only
+happens after O(N) operations, so set and delete
+take O(1) amortized expected time.
+
+There is also an open addressing table which
+stores the keys and values in flat arrays instead
+of linked lists, and uses Robin Hood probing.
+
+The hash function is pluggable. Besides the dot
+product family there are the multiply-shift and
+tabulation families, which hash a key with one
+multiplication or eight table lookups instead of
+O(r) divisions, and every family can hash a whole
+NumPy array of keys at once for the batch
+get_many and set_many operations.
+
 """
 
 
+from functools import partial
 from random import randint
+from time import time
+
+import numpy as np
+
+
+MASK_64 = (1 << 64) - 1
+
+
+class DotProductHash(object):
+  """
+  Dot product hash function drawn from a universal family
+
+  m: size of the table, range of the hash function is {0, 1, ..., m - 1}
+  u: size of all possible inputs for keys, domain of hash function {0, 1, ..., u - 1}
+
+  hash_many needs m < 2 ** 32, so the products of two
+  digits fit in 64 bits
+
+  param: m {int}
+  param: r {int}
+  param: a {int} the random constant, drawn if not given
+
+  """
+  def __init__(self, m, r, a=None):
+    self.m = m
+    self.r = r
+    self.u = m ** r
+    self.a = randint(0, self.u - 1) if a is None else a
+    self.digits = []
+    a = self.a
+    for _ in range(r):
+      self.digits.append(a % m)
+      a //= m
+
+  def params(self):
+    """
+    Return the parameters which rebuild this function
+    with DotProductHash(**params)
+
+    """
+    return {'m': self.m, 'r': self.r, 'a': self.a}
+
+  def __call__(self, key):
+    """
+    The dot product hash function takes
+    the dot product of the coefficients
+    of the input, key, and the randomly
+    chosen constant, a, both represented
+    as polynomials base m, our table size.
+
+    i.e.
+    key = k_0 + (k_1 * m) + (k_2 * (m ** 2)) + ... + (a_(r - 1) * (m ** (r - 1)))
+    a = a_0 + (a_1 * m) + (a_2 * (m ** 2)) + ... + (k_(r - 1) * (m ** (r - 1)))
+
+    h_a(key) = sum(k_i * a_i for i in range(r)) % m
+
+    """
+    key = key % self.u
+    result = 0
+    for a_i in self.digits:
+      result += (key % self.m) * a_i
+      key //= self.m
+    return result % self.m
+
+  def hash_many(self, keys):
+    """
+    Hash an array of non-negative integer keys,
+    each digit is handled for all keys at once
+
+    Complexity: O(r * n) with r vectorized steps
+
+    """
+    keys = np.asarray(keys).astype(np.uint64)
+    if self.u < 1 << 64:
+      keys %= np.uint64(self.u)
+    m = np.uint64(self.m)
+    result = np.zeros(len(keys), dtype=np.uint64)
+    for a_i in self.digits:
+      result += (keys % m) * np.uint64(a_i)
+      result %= m
+      keys //= m
+    return result.astype(np.int64)
+
+
+class MultiplyShiftHash(object):
+  """
+  Multiply-shift hash function for 64-bit keys and
+  a table of size m = 2 ** l, drawn from a universal family
+
+  h_a(key) = ((a * key) mod 2 ** 64) >> (64 - l)
+
+  for a random odd 64-bit a. The top l bits of the product
+  depend on every bit of the key, and the hash costs one
+  multiplication and one shift
+
+  param: m {int} a power of 2
+  param: a {int} the random odd multiplier, drawn if not given
+
+  """
+  def __init__(self, m, a=None):
+    if m & (m - 1):
+      raise ValueError(
+        'table size {} is not a power of 2'.format(m))
+    self.m = m
+    self.shift = 64 - (m.bit_length() - 1)
+    self.a = randint(0, MASK_64) | 1 if a is None else a
+
+  def params(self):
+    """
+    Return the parameters which rebuild this function
+    with MultiplyShiftHash(**params)
+
+    """
+    return {'m': self.m, 'a': self.a}
+
+  def __call__(self, key):
+    return ((self.a * key) & MASK_64) >> self.shift
+
+  def hash_many(self, keys):
+    """
+    Hash an array of integer keys, the uint64
+    multiplication wraps around mod 2 ** 64
+
+    Complexity: O(n) with one vectorized step
+
+    """
+    keys = np.asarray(keys).astype(np.uint64)
+    if self.shift == 64:
+      return np.zeros(len(keys), dtype=np.int64)
+    product = keys * np.uint64(self.a)
+    return (product >> np.uint64(self.shift)).astype(np.int64)
+
+
+class TabulationHash(object):
+  """
+  Simple tabulation hash function for 64-bit keys and
+  a table of size m, a power of 2
+
+  The key is split into 8 bytes, and each byte indexes
+  its own table of 256 random values in {0, 1, ..., m - 1}
+
+  h(key) = T_0[k_0] ^ T_1[k_1] ^ ... ^ T_7[k_7]
+
+  This family is 3-independent, which is stronger than
+  universal, and it only needs table lookups and xors
+
+  param: m {int} a power of 2
+  param: tables {list} the 8 lists of 256 random values, drawn if not given
+
+  """
+  def __init__(self, m, tables=None):
+    if m & (m - 1):
+      raise ValueError(
+        'table size {} is not a power of 2'.format(m))
+    self.m = m
+    if tables is None:
+      tables = [[randint(0, m - 1) for _ in range(256)] for _ in range(8)]
+    self.tables = tables
+    self._arrays = np.array(tables, dtype=np.int64)
+
+  def params(self):
+    """
+    Return the parameters which rebuild this function
+    with TabulationHash(**params)
+
+    """
+    return {'m': self.m, 'tables': self.tables}
+
+  def __call__(self, key):
+    key &= MASK_64
+    result = 0
+    for table in self.tables:
+      result ^= table[key & 255]
+      key >>= 8
+    return result
+
+  def hash_many(self, keys):
+    """
+    Hash an array of integer keys, looking up
+    byte i of every key in table i at once
+
+    Complexity: O(n) with 8 vectorized steps
+
+    """
+    keys = np.asarray(keys).astype(np.uint64)
+    result = np.zeros(len(keys), dtype=np.int64)
+    for i in range(8):
+      result ^= self._arrays[i][(keys >> np.uint64(8 * i)) & np.uint64(255)]
+    return result
 
 
 class LinkedListNode(object):
@@ -24,6 +234,15 @@ class LinkedListNode(object):
     self.next = None
 
 
+# The hash families by name, so a saved hash function
+# can be rebuilt from its name and params()
+HASH_FAMILIES = {
+  'DotProductHash': DotProductHash,
+  'MultiplyShiftHash': MultiplyShiftHash,
+  'TabulationHash': TabulationHash,
+}
+
+
 class DotProductHashTable(object):
   """
   Hash table with integer keys
@@ -34,40 +253,122 @@ class DotProductHashTable(object):
   m: size of the table, range of the hash function is {0, 1, ..., m - 1}
   u: size of all possible inputs for keys, domain of hash function {0, 1, ..., u - 1}
 
+  The table doubles when the load factor goes above max_load
+  and halves when it goes below min_load, but never shrinks
+  below its initial size
+
+  hash_family is called with the table size to draw a new
+  hash function, e.g. MultiplyShiftHash or TabulationHash,
+  which need m to be a power of 2. The default is the dot
+  product family with r digits
+
   param: m {int}
   param: r {int}
+  param: max_load {float}
+  param: min_load {float}
+  param: hash_family {callable}
 
   """
-  def __init__(self, m, r):
-    self.m = m
+  def __init__(self, m, r, max_load=1.0, min_load=0.25, hash_family=None):
     self.r = r
-    self.u = m ** r
-    self.a = randint(0, self.u - 1)
+    self.hash_family = hash_family or partial(DotProductHash, r=r)
+    self.min_size = m
+    self.max_load = max_load
+    self.min_load = min_load
+    self.count = 0
+    self._reset(m)
+
+  def __len__(self):
+    return self.count
+
+  def _reset(self, m):
+    """
+    Empty the table and give it m slots
+    and a newly drawn hash function
+
+    """
+    self.m = m
+    self.hash = self.hash_family(m)
     self.table = [None] * m
 
+  @property
+  def a(self):
+    """
+    The random constant of the current hash function,
+    for families which have one
+
+    """
+    return self.hash.a
+
+  @property
+  def u(self):
+    """
+    The size of the key universe of the current hash
+    function, for the dot product family
+
+    """
+    return self.hash.u
+
   def dot_product_hash(self, key):
     """
-    The dot product hash function takes
-    the dot product of the coefficients
-    of the input, key, and the randomly
-    chosen constant, a, both represented
-    as polynomials base m, our table size.
+    Hash key with the table's current hash function
 
-    i.e.
-    key = k_0 + (k_1 * m) + (k_2 * (m ** 2)) + ... + (a_(r - 1) * (m ** (r - 1)))
-    a = a_0 + (a_1 * m) + (a_2 * (m ** 2)) + ... + (k_(r - 1) * (m ** (r - 1)))
+    """
+    return self.hash(key)
 
-    h_a(key) = sum(k_i * a_i for i in range(r)) % m
+  def items(self):
+    """
+    Yield every (key, val) pair in the table
 
     """
-    key = key % self.u
-    a = self.a
-    result = 0
-    for _ in range(self.r):
-      result += (key % self.m) * (a % self.m)
-      key //= self.m
-      a //= self.m
-    return result % self.m
+    for cur in self.table:
+      while cur is not None:
+        yield cur.key, cur.val
+        cur = cur.next
+
+  def _resize(self, m):
+    """
+    Move every key into a new table with m slots
+    and a new hash function
+
+    Complexity: O(N + m)
+
+    """
+    items = list(self.items())
+    self._reset(m)
+    for key, val in items:
+      self._set(self.hash(key), key, val)
+
+  def reserve(self, n):
+    """
+    Grow the table so it can hold n keys without
+    going above max_load, which avoids resizing
+    several times while a batch of keys is set
+
+    """
+    m = self.m
+    while n > self.max_load * m:
+      m *= 2
+    if m != self.m:
+      self._resize(m)
+
+  def _set(self, h, key, val):
+    """
+    Store val at key, whose hash is h, without resizing,
+    returns True if the key was not already in the table
+
+    """
+    if self.table[h] is None:
+      self.table[h] = LinkedListNode(key, val)
+      return True
+    cur = self.table[h]
+    while cur.next is not None and cur.key != key:
+      cur = cur.next
+    if cur.key == key:
+      cur.val = val
+      return False
+    cur.next = LinkedListNode(key, val)
+    return True
 
   def set(self, key, val):
     """
@@ -76,17 +377,25 @@ class DotProductHashTable(object):
     it will overwrite it
 
     """
-    h = self.dot_product_hash(key)
-    if self.table[h] is None:
-      self.table[h] = LinkedListNode(key, val)
-    else:
-      cur = self.table[h]
-      while cur.next is not None and cur.key != key:
-        cur = cur.next
-      if cur.key == key:
-        cur.val = val
-      else:
-        cur.next = LinkedListNode(key, val)
+    if self._set(self.hash(key), key, val):
+      self.count += 1
+      if self.count > self.max_load * self.m:
+        self._resize(2 * self.m)
+
+  def set_many(self, keys, vals):
+    """
+    Set each key in the integer array keys to
+    the matching val. The table is grown once
+    up front, then all the keys are hashed in
+    one vectorized step
+
+    """
+    keys = np.asarray(keys)
+    self.reserve(self.count + len(keys))
+    hashes = self.hash.hash_many(keys).tolist()
+    for h, key, val in zip(hashes, keys.tolist(), vals):
+      if self._set(h, key, val):
+        self.count += 1
 
   def get(self, key):
     """
@@ -95,7 +404,26 @@ class DotProductHashTable(object):
     return None
 
     """
-    h = self.dot_product_hash(key)
+    return self._get(self.hash(key), key)
+
+  def get_many(self, keys):
+    """
+    Return the list of values stored at each key in
+    the integer array keys, with None for missing
+    keys. All the keys are hashed in one vectorized
+    step, then each one is looked up in its slot
+
+    """
+    keys = np.asarray(keys)
+    hashes = self.hash.hash_many(keys).tolist()
+    return [self._get(h, key) for h, key in zip(hashes, keys.tolist())]
+
+  def _get(self, h, key):
+    """
+    Gets the value stored at key, whose hash
+    is h, or None if it is not in the table
+
+    """
     if self.table[h] is None:
       return None
     cur = self.table[h]
@@ -104,3 +432,204 @@ class DotProductHashTable(object):
     if cur.key == key:
       return cur.val
     return None
+
+  def _delete(self, key):
+    """
+    Remove key from the table without resizing,
+    raises a KeyError if the key is not in the table
+
+    """
+    h = self.hash(key)
+    prev = None
+    cur = self.table[h]
+    while cur is not None and cur.key != key:
+      prev = cur
+      cur = cur.next
+    if cur is None:
+      raise KeyError(
+        'key {} is not in the table'.format(key))
+    if prev is None:
+      self.table[h] = cur.next
+    else:
+      prev.next = cur.next
+
+  def delete(self, key):
+    """
+    Deletes the key and its value from the table,
+    raises a KeyError if the key is not in the table
+
+    """
+    self._delete(key)
+    self.count -= 1
+    if self.m > self.min_size and self.count < self.min_load * self.m:
+      self._resize(max(self.m // 2, self.min_size))
+
+
+# Marks a slot which has never held a key in RobinHoodHashTable
+_EMPTY = object()
+
+
+class RobinHoodHashTable(DotProductHashTable):
+  """
+  Open addressing hash table which uses the same
+  universal hash function as DotProductHashTable
+
+  Instead of chaining, the keys and values are stored
+  in two flat arrays, and a key which hashes to a full
+  slot is stored in the next free slot (linear probing).
+  With Robin Hood probing, a key being inserted takes
+  the slot of any key which is closer to its home slot,
+  which keeps the probe lengths short and even, and lets
+  a lookup stop as soon as it passes the place where its
+  key would have been
+
+  Deletion shifts the following keys back by one slot
+  instead of leaving a marker behind
+
+  """
+  def __init__(self, m, r, max_load=0.7, min_load=0.175, hash_family=None):
+    DotProductHashTable.__init__(self, m, r, max_load, min_load, hash_family)
+
+  def _reset(self, m):
+    """
+    Empty the table and give it m slots
+    and a newly drawn hash function
+
+    """
+    DotProductHashTable._reset(self, m)
+    self.table = None
+    self.keys = [_EMPTY] * m
+    self.vals = [None] * m
+    self.dists = [0] * m  # how far each key is from its home slot
+
+  def items(self):
+    """
+    Yield every (key, val) pair in the table
+
+    """
+    for i, key in enumerate(self.keys):
+      if key is not _EMPTY:
+        yield key, self.vals[i]
+
+  def _find(self, h, key):
+    """
+    Return the slot holding key, whose hash
+    is h, or -1 if it is not in the table
+
+    """
+    i = h
+    d = 0
+    while self.keys[i] is not _EMPTY and d <= self.dists[i]:
+      if self.keys[i] == key:
+        return i
+      i = (i + 1) % self.m
+      d += 1
+    return -1
+
+  def _set(self, h, key, val):
+    """
+    Store val at key, whose hash is h, without resizing,
+    returns True if the key was not already in the table
+
+    """
+    i = h
+    d = 0
+    while self.keys[i] is not _EMPTY:
+      if self.keys[i] == key:
+        self.vals[i] = val
+        return False
+      if self.dists[i] < d:
+        # the key in this slot is closer to home, so it gives up its slot
+        self.keys[i], key = key, self.keys[i]
+        self.vals[i], val = val, self.vals[i]
+        self.dists[i], d = d, self.dists[i]
+      i = (i + 1) % self.m
+      d += 1
+    self.keys[i] = key
+    self.vals[i] = val
+    self.dists[i] = d
+    return True
+
+  def _get(self, h, key):
+    """
+    Gets the value stored at key, whose hash
+    is h, or None if it is not in the table
+
+    """
+    i = self._find(h, key)
+    return None if i == -1 else self.vals[i]
+
+  def _delete(self, key):
+    """
+    Remove key from the table without resizing,
+    raises a KeyError if the key is not in the table
+
+    """
+    i = self._find(self.hash(key), key)
+    if i == -1:
+      raise KeyError(
+        'key {} is not in the table'.format(key))
+    k = (i + 1) % self.m
+    while self.keys[k] is not _EMPTY and self.dists[k] > 0:
+      self.keys[i] = self.keys[k]
+      self.vals[i] = self.vals[k]
+      self.dists[i] = self.dists[k] - 1
+      i, k = k, (k + 1) % self.m
+    self.keys[i] = _EMPTY
+    self.vals[i] = None
+    self.dists[i] = 0
+
+
+def benchmark(n=10 ** 5):
+  """
+  Time n sets, gets, and deletes of random keys in
+  the chained and Robin Hood tables with each hash
+  family and in the built-in dict, then time set_many
+  and get_many on the same keys
+
+  """
+  keys = list(set(randint(0, (1 << 32) - 1) for _ in range(n)))
+  families = [
+    ('dot product', None),
+    ('multiply-shift', MultiplyShiftHash),
+    ('tabulation', TabulationHash),
+  ]
+  tables = [('dict', None)]
+  for family_name, family in families:
+    tables.append(('chaining, ' + family_name,
+      DotProductHashTable(16, 8, hash_family=family)))
+    tables.append(('robin hood, ' + family_name,
+      RobinHoodHashTable(16, 8, hash_family=family)))
+  for name, table in tables:
+    if table is None:
+      d = {}
+      table_set, table_get = d.__setitem__, d.get
+      table_delete = d.__delitem__
+    else:
+      table_set, table_get, table_delete = table.set, table.get, table.delete
+    times = []
+    for op in (
+      lambda key: table_set(key, key),
+      table_get,
+      table_delete,
+    ):
+      start = time()
+      for key in keys:
+        op(key)
+      times.append(time() - start)
+    print('{:<28}set {:.3f}s, get {:.3f}s, delete {:.3f}s'.format(
+      name, *times))
+  key_array = np.array(keys, dtype=np.int64)
+  for name, table in tables[1:]:
+    start = time()
+    table.set_many(key_array, keys)
+    set_time = time() - start
+    start = time()
+    table.get_many(key_array)
+    get_time = time() - start
+    print('{:<28}set_many {:.3f}s, get_many {:.3f}s'.format(
+      name, set_time, get_time))
+
+
+if __name__ == '__main__':
+  benchmark()
@@ -4,156 +4,174 @@ AVL Tree Implementation
 -----------------------
 An AVL tree implementation
 with parent pointers and where
-each node stores the size of
-its subtree
+each node stores the size and
+height of its subtree
+
+Inserts and deletes only update
+and rebalance the nodes on the
+path from the root to the key,
+so they take O(log(N)) time
+
+Trees can also be built from sorted
+keys in O(N) time, and joined and
+split, which gives union, intersection,
+and difference of two trees with M and
+N keys (M <= N) in O(M * log(N / M + 1))
+time
 
 """
 
 
+from copy import copy
+from random import randint
+from time import time
+
+
 class AVLTreeNode(object):
   """
-  AVL Tree Node with size
+  AVL Tree Node with size, height,
   and parent pointers
 
   """
   def __init__(self, key):
     self.size = 1
+    self.height = 1
     self.key = key
     self.min = key
     self.max = key
     self.left = self.right = self.parent = None
 
-  def _decrease_parent_count(self):
+  def _create_new(self, key):
     """
-    Traverse the tree by parent pointer
-    and update the size
+    Create a new tree node
 
     """
-    if self.parent is not None:
-      self.parent.size -= 1
-      self.parent._decrease_parent_count()
+    return AVLTreeNode(key)
 
-  def _create_new(self, key):
+  def _update(self):
     """
-    Create a new tree node
+    Recompute the size, height, min, and max
+    of this node from its children, which
+    must already be up to date
+
+    Subclasses which store more augmented data
+    override this to recompute it as well
+
+    Complexity: O(1)
 
     """
-    return AVLTreeNode(key)
+    left, right = self.left, self.right
+    self.size = 1 + (0 if left is None else left.size) \
+      + (0 if right is None else right.size)
+    self.height = 1 + max(
+      self._get_left_height(),
+      self._get_right_height(),
+    )
+    self.min = self.key if left is None else left.min
+    self.max = self.key if right is None else right.max
+
+  def _get_successor(self):
+    """
+    Get this node's successor
+
+    """
+    tmp = self.right
+    while tmp.left:
+      tmp = tmp.left
+    return tmp
 
   def _insert(self, key):
     """
-    Binary search tree insert function
-    with size augmentation
+    Binary search tree insert function which
+    rebalances each node on the path back up
+    and returns the new root of the subtree
 
     Complexity: O(log(N)) where N is number of nodes in the tree
 
     """
-    if self.min > key:
-      self.min = key
-    if self.max < key:
-      self.max = key
     if key == self.key:
       return self
-    self.size += 1
     if key < self.key:
       if self.left is None:
         self.left = self._create_new(key)
         self.left.parent = self
-        return self
-      self.left = self.left._insert(key)
+      else:
+        self.left = self.left._insert(key)
     else:
       if self.right is None:
         self.right = self._create_new(key)
         self.right.parent = self
-        return self
-      self.right = self.right._insert(key)
-    return self
-
-  def _update_min(self):
-    """
-    Update the minimum value when the current
-    min value in the subtree is being deleted
+      else:
+        self.right = self.right._insert(key)
+    return self._balance()
 
+  def _delete(self, key):
     """
-    tmp = self
-    while tmp.left is not None:
-      tmp = tmp.left
-    return tmp.parent.key
+    Delete a key from a BST, rebalancing each node
+    on the path back up, and return the new root of
+    the subtree, which is None if it is now empty.
+    Does nothing if the key is not in the subtree
 
-  def _update_max(self):
-    """
-    Update the maximum value when the current
-    max value in the subtree is being deleted
+    Complexity: O(log(N)) where N is number of nodes in the tree
 
     """
-    tmp = self
-    while tmp.right is not None:
-      tmp = tmp.right
-    return tmp.parent.key
+    if key < self.key:
+      if self.left is None:
+        return self
+      self.left = self.left._delete(key)
+      if self.left is not None:
+        self.left.parent = self
+    elif key > self.key:
+      if self.right is None:
+        return self
+      self.right = self.right._delete(key)
+      if self.right is not None:
+        self.right.parent = self
+    elif self.left is None or self.right is None:
+      # zero or one child case: the child takes this node's place
+      child = self.right if self.left is None else self.left
+      if child is not None:
+        child.parent = self.parent
+      return child
+    else:
+      # two children case: copy the successor's key into this node
+      # then remove the successor from the right subtree
+      self._copy_key(self._get_successor())
+      self.right = self.right._delete_min()
+      if self.right is not None:
+        self.right.parent = self
+    return self._balance()
 
-  def _get_successor(self):
+  def _copy_key(self, node):
     """
-    Get this node's successor
+    Copy the key of another node into this one, subclasses
+    which store data with each key override this to copy it too
 
     """
-    tmp = self.right
-    while tmp.left:
-      tmp = tmp.left
-    return tmp
+    self.key = node.key
 
-  def _delete(self, key):
+  def _delete_min(self):
     """
-    Delete a keyue from a BST
+    Remove the node with the smallest key from the
+    subtree and return the new root of the subtree
 
-    Complexity: O(log(N)) where N is number of nodes in the tree
+    Complexity: O(log(N))
 
     """
-    if key == self.key:
-      self._decrease_parent_count()
-
-      if self.size == 1:  # leaf case
-        return None
-
-      if self.left is None:  # no left child case
-        if self.parent is None:
-          self.right.parent = None
-          return self.right  # root case: right child is new root
+    if self.left is None:
+      if self.right is not None:
         self.right.parent = self.parent
-        return self.right
-
-      if self.right is None:  # no right child case
-        if self.parent is None:
-          self.left.parent = None
-          return self.left  # root case: left child is new root
-        self.left.parent = self.parent
-        return self.left
-
-      # two children case: swap the keyue of this node with its successor then
-      # recursively call delete on the right subtree
-      tmp = self._get_successor()
-      self.key, tmp.key = tmp.key, self.key
-      if tmp == self.right:
-        self.right = tmp._delete(key)
-      else:
-        tmp.parent.left = tmp._delete(key)
-      return self
-
-    if key == self.min:
-      self._update_min()
-    if key == self.max:
-      self._update_max()
-
-    if key < self.key and self.left is not None:
-      self.left = self.left._delete(key)
-    elif key > self.key and self.right is not None:
-      self.right = self.right._delete(key)
-    return self
+      return self.right
+    self.left = self.left._delete_min()
+    if self.left is not None:
+      self.left.parent = self
+    return self._balance()
 
   def _rotate_left(self):
     """
     Rotate a tree left and return the new root
 
-    Modifies the size of the nodes as well
+    Updates the augmented data of the two nodes as well
 
     """
     tmp = self.right
@@ -163,15 +181,15 @@ class AVLTreeNode(object):
       self.right.parent = self
     tmp.left = self
     self.parent = tmp
-    self.size -= 1 + (0 if tmp.right is None else tmp.right.size)
-    tmp.size += 1 + (0 if self.left is None else self.left.size)
+    self._update()
+    tmp._update()
     return tmp
 
   def _rotate_right(self):
     """
     Rotate a tree right and return the new root
 
-    Modifies the size of the nodes as well
+    Updates the augmented data of the two nodes as well
 
     Same as rotate left but with any 'left' or 'right' keys
     switched
@@ -184,8 +202,8 @@ class AVLTreeNode(object):
       self.left.parent = self
     tmp.right = self
     self.parent = tmp
-    self.size -= 1 + (0 if tmp.left is None else tmp.left.size)
-    tmp.size += 1 + (0 if self.right is None else self.right.size)
+    self._update()
+    tmp._update()
     return tmp
 
   def _get_left_height(self):
@@ -193,39 +211,34 @@ class AVLTreeNode(object):
     Get the height of the node's left subtree
 
     """
-    if self.left is None:
-      return 0
-    return 1 + max(
-      self.left._get_left_height(),
-      self.left._get_right_height(),
-    )
+    return 0 if self.left is None else self.left.height
 
   def _get_right_height(self):
     """
     Get the height of the node's right subtree
 
     """
-    if self.right is None:
-      return 0
-    return 1 + max(
-      self.right._get_left_height(),
-      self.right._get_right_height(),
-    )
+    return 0 if self.right is None else self.right.height
 
   def _balance(self):
     """
-    Balances an AVL tree recursively
+    Update this node and rebalance it with a single or
+    double rotation if its subtrees' heights differ by 2,
+    assuming both subtrees are already balanced
+
+    Complexity: O(1)
 
     """
-    if self.left is not None:
-      self.left = self.left._balance()
-    if self.right is not None:
-      self.right = self.right._balance()
+    self._update()
     left_height = self._get_left_height()
     right_height = self._get_right_height()
-    if abs(left_height - right_height) > 1:
-      if left_height > right_height:
-        return self._rotate_right()
+    if left_height > right_height + 1:
+      if self.left._get_right_height() > self.left._get_left_height():
+        self.left = self.left._rotate_left()
+      return self._rotate_right()
+    if right_height > left_height + 1:
+      if self.right._get_left_height() > self.right._get_right_height():
+        self.right = self.right._rotate_right()
       return self._rotate_left()
     return self
 
@@ -245,18 +258,22 @@ class AVLTreeNode(object):
   def insert(self, key):
     """
     Insert a key into the subtree rooted at this node
+    and return the new root of the subtree
+
+    Complexity: O(log(N))
 
     """
-    node = self._insert(key)
-    return node._balance()
+    return self._insert(key)
 
   def delete(self, key):
     """
     Delete a key from the subtree rooted at this node
+    and return the new root of the subtree
+
+    Complexity: O(log(N))
 
     """
-    node = self._delete(key)
-    return node._balance()
+    return self._delete(key)
 
   def traverse(self):
     """
@@ -276,6 +293,183 @@ class AVLTreeNode(object):
     return res
 
 
+def _height(node):
+  return 0 if node is None else node.height
+
+
+def _detach(node):
+  """
+  Make a subtree into a tree of its own
+
+  """
+  if node is not None:
+    node.parent = None
+  return node
+
+
+def build_balanced(Node, keys, lo, hi):
+  """
+  Build a perfectly balanced tree of Node from the
+  sorted keys[lo:hi] and return its root
+
+  Complexity: O(hi - lo)
+
+  """
+  if lo >= hi:
+    return None
+  mid = (lo + hi) // 2
+  node = Node(keys[mid])
+  node.left = build_balanced(Node, keys, lo, mid)
+  node.right = build_balanced(Node, keys, mid + 1, hi)
+  if node.left is not None:
+    node.left.parent = node
+  if node.right is not None:
+    node.right.parent = node
+  node._update()
+  return node
+
+
+def join(left, node, right):
+  """
+  Join the trees left and right and the single node
+  into one tree and return its root, all keys in left
+  must be less than node.key and all keys in right greater
+
+  The node is attached where the taller tree's spine
+  reaches the height of the shorter tree, then the nodes
+  above it are rebalanced
+
+  Complexity: O(|height(left) - height(right)| + 1)
+
+  """
+  if _height(left) > _height(right) + 1:
+    left.right = join(left.right, node, right)
+    left.right.parent = left
+    return left._balance()
+  if _height(right) > _height(left) + 1:
+    right.left = join(left, node, right.left)
+    right.left.parent = right
+    return right._balance()
+  node.left = left
+  node.right = right
+  if left is not None:
+    left.parent = node
+  if right is not None:
+    right.parent = node
+  node._update()
+  return node
+
+
+def _split_last(root):
+  """
+  Remove the node with the largest key from the
+  tree and return the rest of the tree and the node
+
+  Complexity: O(log(N))
+
+  """
+  if root.right is None:
+    rest = _detach(root.left)
+    root.left = None
+    root._update()
+    return rest, root
+  rest, last = _split_last(root.right)
+  root.right = rest
+  if rest is not None:
+    rest.parent = root
+  return root._balance(), last
+
+
+def join2(left, right):
+  """
+  Join the trees left and right, all keys in left
+  must be less than all keys in right
+
+  Complexity: O(log(N))
+
+  """
+  if left is None:
+    return right
+  left, last = _split_last(left)
+  return join(_detach(left), last, right)
+
+
+def split(root, key):
+  """
+  Split a tree into the tree of keys less than key,
+  the node with the key or None, and the tree of keys
+  greater than key
+
+  Complexity: O(log(N))
+
+  """
+  if root is None:
+    return None, None, None
+  left, right = _detach(root.left), _detach(root.right)
+  root.left = root.right = root.parent = None
+  root._update()
+  if key == root.key:
+    return left, root, right
+  if key < root.key:
+    lower, found, upper = split(left, key)
+    return lower, found, _detach(join(upper, root, right))
+  lower, found, upper = split(right, key)
+  return _detach(join(left, root, lower)), found, upper
+
+
+def union(a, b):
+  """
+  Return the root of a tree with the keys of both
+  trees, the nodes of both are reused
+
+  Complexity: O(M * log(N / M + 1))
+
+  """
+  if a is None:
+    return b
+  if b is None:
+    return a
+  lower, _, upper = split(b, a.key)
+  left, right = _detach(a.left), _detach(a.right)
+  a.left = a.right = None
+  return _detach(join(union(left, lower), a, union(right, upper)))
+
+
+def intersection(a, b):
+  """
+  Return the root of a tree with the keys in
+  both trees, the nodes of both are reused
+
+  Complexity: O(M * log(N / M + 1))
+
+  """
+  if a is None or b is None:
+    return None
+  lower, found, upper = split(b, a.key)
+  left, right = _detach(a.left), _detach(a.right)
+  a.left = a.right = None
+  left = intersection(left, lower)
+  right = intersection(right, upper)
+  if found is None:
+    return _detach(join2(left, right))
+  return _detach(join(left, a, right))
+
+
+def difference(a, b):
+  """
+  Return the root of a tree with the keys in a
+  which are not in b, the nodes of both are reused
+
+  Complexity: O(M * log(N / M + 1))
+
+  """
+  if a is None or b is None:
+    return a
+  lower, _, upper = split(a, b.key)
+  left, right = _detach(b.left), _detach(b.right)
+  return _detach(join2(difference(lower, left), difference(upper, right)))
+
+
 class BinaryTree(object):
   """
   General balanced binary tree class
@@ -325,6 +519,91 @@ class BinaryTree(object):
       return ''
     return self.root.traverse()
 
+  @classmethod
+  def from_sorted(cls, iterable):
+    """
+    Build a perfectly balanced tree from an iterable
+    of keys in strictly increasing order
+
+    Complexity: O(N)
+
+    """
+    keys = list(iterable)
+    for i in range(1, len(keys)):
+      if keys[i - 1] >= keys[i]:
+        raise ValueError(
+          'keys are not in strictly increasing order at index {}'.format(i))
+    t = cls()
+    t.root = build_balanced(t.Node, keys, 0, len(keys))
+    return t
+
+  def _with_root(self, root):
+    """
+    Return a new tree of the same type with the given root
+
+    """
+    t = copy(self)
+    t.root = root
+    return t
+
+  def join(self, other):
+    """
+    Move all the keys of other, which must all be
+    greater than the keys in this tree, into this tree
+
+    Complexity: O(log(N))
+
+    """
+    if self.root is not None and other.root is not None \
+      and self.root.max >= other.root.min:
+        raise ValueError(
+          'keys of the joined tree must be greater than the keys of this tree')
+    self.root = _detach(join2(self.root, other.root))
+    other.root = None
+
+  def split(self, key):
+    """
+    Split the tree into a tree of the keys less than
+    key and a tree of the keys greater than or equal
+    to key and return both, leaving this tree empty
+
+    Complexity: O(log(N))
+
+    """
+    lower, found, upper = split(self.root, key)
+    if found is not None:
+      upper = _detach(join(None, found, upper))
+    self.root = None
+    return self._with_root(lower), self._with_root(upper)
+
+  def union(self, other):
+    """
+    Add all the keys of other to this tree,
+    reusing the nodes of other and leaving it empty
+
+    """
+    self.root = union(self.root, other.root)
+    other.root = None
+
+  def intersection(self, other):
+    """
+    Keep only the keys of this tree which are also
+    in other, reusing the nodes of other and leaving
+    it empty
+
+    """
+    self.root = intersection(self.root, other.root)
+    other.root = None
+
+  def difference(self, other):
+    """
+    Remove the keys of other from this tree,
+    reusing the nodes of other and leaving it empty
+
+    """
+    self.root = difference(self.root, other.root)
+    other.root = None
+
 
 class AVLTree(BinaryTree):
   """
@@ -333,3 +612,30 @@ class AVLTree(BinaryTree):
   """
   def __init__(self):
     BinaryTree.__init__(self, AVLTreeNode)
+
+
+def benchmark(n=10 ** 6):
+  """
+  Insert n random keys into an AVL tree, timing
+  each time the tree doubles, then check that its
+  height is within the AVL bound of 1.44 * log2(N)
+
+  """
+  t = AVLTree()
+  start = time()
+  inserted = 0
+  checkpoint = 1024
+  while inserted < n:
+    t.insert(randint(0, 1 << 62))
+    inserted += 1
+    if inserted == checkpoint or inserted == n:
+      elapsed = time() - start
+      print('{:>8} keys: {:.2f}s, {:.2f}us per insert, height {}'.format(
+        inserted, elapsed, 1e6 * elapsed / inserted, t.root.height))
+      checkpoint *= 2
+  if t.root.height > 1.44 * (t.root.size.bit_length() + 1):
+    raise Exception('AVL tree is not balanced')
+
+
+if __name__ == '__main__':
+  benchmark()
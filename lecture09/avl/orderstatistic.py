@@ -7,9 +7,17 @@ compute the rank of each node and
 select a node at particular rank in
 O(log(N)) time
 
+In multiset mode each node also
+counts the copies of its key, and
+sizes count every copy, so a key
+added twice has two ranks
+
 """
 
 
+from bisect import bisect_left
+from collections import deque
+
 from avl import AVLTreeNode, BinaryTree
 
 
@@ -29,6 +37,16 @@ class OrderStatTreeNode(AVLTreeNode):
     """
     return OrderStatTreeNode(key)
 
+  def _count(self):
+    """
+    Get the number of copies of this node's key,
+    the part of its size not in its subtrees
+
+    """
+    return self.size \
+      - (0 if self.left is None else self.left.size) \
+      - (0 if self.right is None else self.right.size)
+
   def rank(self):
     """
     Get the rank of the node (i.e. the index of the node in an ordered list)
@@ -39,7 +57,28 @@ class OrderStatTreeNode(AVLTreeNode):
     while tmp.parent is not None:
       tmp = tmp.parent
       if tmp.key < self.key:
-        r += 1 + (0 if tmp.left is None else tmp.left.size)
+        r += tmp.size - (0 if tmp.right is None else tmp.right.size)
+    return r
+
+  def rank_of(self, key):
+    """
+    Get the number of keys in the subtree less than key
+    with a single walk down from this node, the key does
+    not need to be in the tree
+
+    Complexity: O(log(N))
+
+    """
+    r = 0
+    node = self
+    while node is not None:
+      if key <= node.key:
+        if key == node.key:
+          return r + (0 if node.left is None else node.left.size)
+        node = node.left
+      else:
+        r += node.size - (0 if node.right is None else node.right.size)
+        node = node.right
     return r
 
   def select(self, i):
@@ -48,7 +87,7 @@ class OrderStatTreeNode(AVLTreeNode):
 
     """
     r = 0 if self.left is None else self.left.size
-    if i == r:
+    if r <= i < r + self._count():
       return self
     if i < r:
       if self.left is None:
@@ -56,7 +95,104 @@ class OrderStatTreeNode(AVLTreeNode):
       return self.left.select(i)
     if self.right is None:
       return None
-    return self.right.select(i - r - 1)
+    return self.right.select(i - r - self._count())
+
+  def _select_many(self, ranks, lo, hi, offset, out):
+    """
+    Set out[k] to the node with rank ranks[k] for each
+    k in lo, ..., hi - 1, where ranks is sorted and
+    offset is the number of keys before this subtree
+
+    The ranks are split around this node with two binary
+    searches, so each subtree is entered at most once
+
+    """
+    left_size = 0 if self.left is None else self.left.size
+    mid = offset + left_size
+    i = bisect_left(ranks, mid, lo, hi)
+    j = bisect_left(ranks, mid + self._count(), i, hi)
+    if lo < i:
+      self.left._select_many(ranks, lo, i, offset, out)
+    for k in range(i, j):
+      out[k] = self
+    if j < hi:
+      self.right._select_many(ranks, j, hi, mid + self._count(), out)
+
+  def select_many(self, ranks):
+    """
+    Get the nodes with each of the sorted ranks
+    in one ordered walk of the tree
+
+    Complexity: O(K * log(N / K + 1)) for K ranks
+
+    """
+    out = [None] * len(ranks)
+    if ranks:
+      self._select_many(ranks, 0, len(ranks), 0, out)
+    return out
+
+
+class MultisetTreeNode(OrderStatTreeNode):
+  """
+  Order statistic node which stores the number
+  of copies of its key, inserting a key which is
+  already in the tree adds a copy and deleting it
+  removes a copy
+
+  """
+  def __init__(self, key):
+    OrderStatTreeNode.__init__(self, key)
+    self.count = 1
+
+  def _create_new(self, key):
+    """
+    Create a new instance of a node
+
+    """
+    return MultisetTreeNode(key)
+
+  def _update(self):
+    """
+    Sizes count every copy of each key
+
+    """
+    OrderStatTreeNode._update(self)
+    self.size += self.count - 1
+
+  def _count(self):
+    return self.count
+
+  def _copy_key(self, node):
+    """
+    Copy the key and its number of copies
+
+    """
+    self.key = node.key
+    self.count = node.count
+
+  def _insert(self, key):
+    """
+    Add a copy of the key if it is in this node,
+    otherwise insert it into the subtree
+
+    """
+    if key == self.key:
+      self.count += 1
+      self._update()
+      return self
+    return OrderStatTreeNode._insert(self, key)
+
+  def _delete(self, key):
+    """
+    Remove a copy of the key if this node has
+    more than one, otherwise delete the node
+
+    """
+    if key == self.key and self.count > 1:
+      self.count -= 1
+      self._update()
+      return self
+    return OrderStatTreeNode._delete(self, key)
 
 
 class OrderStatisticTree(BinaryTree):
@@ -66,9 +202,15 @@ class OrderStatisticTree(BinaryTree):
 
   Can also find the rank of a provided keyue in the
   tree
+
+  If multiset is True, the tree keeps duplicate keys
   """
-  def __init__(self):
-    BinaryTree.__init__(self, OrderStatTreeNode)
+  def __init__(self, multiset=False):
+    BinaryTree.__init__(
+      self, MultisetTreeNode if multiset else OrderStatTreeNode)
+
+  def __len__(self):
+    return 0 if self.root is None else self.root.size
 
   def rank(self, key):
     """
@@ -81,14 +223,96 @@ class OrderStatisticTree(BinaryTree):
     node = self.search(key)
     if node is None:
       return -1
-    return node.rank()
+    return self.root.rank_of(key)
 
   def select(self, i):
     """
     Select the node at rank i in the tree
 
     """
-    if self.root is None or i > self.root.size:
+    if self.root is None or i < 0 or i >= self.root.size:
       raise IndexError(
         'Rank {} out of range'.format(i))
     return self.root.select(i)
+
+  def select_many(self, ranks):
+    """
+    Select the nodes at each of the ranks, which can
+    be in any order, with one walk of the tree
+
+    """
+    order = sorted(range(len(ranks)), key=lambda k: ranks[k])
+    sorted_ranks = [ranks[k] for k in order]
+    if sorted_ranks and (sorted_ranks[0] < 0 or sorted_ranks[-1] >= len(self)):
+      raise IndexError(
+        'Rank {} out of range'.format(
+          sorted_ranks[0] if sorted_ranks[0] < 0 else sorted_ranks[-1]))
+    nodes = self.root.select_many(sorted_ranks) if sorted_ranks else []
+    out = [None] * len(ranks)
+    for k, node in zip(order, nodes):
+      out[k] = node
+    return out
+
+
+class SlidingWindowPercentiles(object):
+  """
+  Percentiles of the last window samples of a stream
+
+  The samples in the window are kept in a multiset
+  order-statistic tree as well as a queue, so adding a
+  sample and evicting the oldest one both take O(log(N))
+  time, and a percentile is the key at the matching rank
+
+  """
+  def __init__(self, window):
+    self.window = window
+    self.samples = deque()
+    self.tree = OrderStatisticTree(multiset=True)
+
+  def __len__(self):
+    return len(self.samples)
+
+  def add(self, x):
+    """
+    Add a sample, evicting the oldest one
+    if the window is full
+
+    Complexity: O(log(N))
+
+    """
+    self.samples.append(x)
+    self.tree.insert(x)
+    if len(self.samples) > self.window:
+      self.tree.delete(self.samples.popleft())
+
+  def _rank(self, p):
+    """
+    Get the rank of the p-th percentile by the nearest-rank
+    method, the smallest sample which at least p percent of
+    the samples are less than or equal to
+
+    """
+    n = len(self.samples)
+    return min(n - 1, max(0, int(-(-p * n // 100)) - 1))
+
+  def percentile(self, p):
+    """
+    Get the p-th percentile of the window, for 0 <= p <= 100
+
+    Complexity: O(log(N))
+
+    """
+    if not self.samples:
+      raise IndexError('no samples in the window')
+    return self.tree.select(self._rank(p)).key
+
+  def percentiles(self, ps):
+    """
+    Get several percentiles of the window, e.g.
+    percentiles([50, 95, 99]), with one walk of the tree
+
+    """
+    if not self.samples:
+      raise IndexError('no samples in the window')
+    return [
+      node.key for node in self.tree.select_many([self._rank(p) for p in ps])]
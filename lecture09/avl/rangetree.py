@@ -14,11 +14,38 @@ which stores integers
 Implementation is based on the code here:
 http://www.cs.uu.nl/docs/vakken/ga/slides5b.pdf
 
+Each node also stores the number and the sum
+of the keys in the leaves of its subtree, so
+aggregates over a range can be computed from
+the O(log(N)) subtrees which cover the range
+without visiting the keys in it
+
+Keys can be inserted and deleted in O(log(N))
+time, the tree is kept balanced with the AVL
+rotations from avl.py. The key of each internal
+node is the largest key in its left subtree,
+which a rotation does not change, since it keeps
+the leaves in the same order
+
 """
 
 
 from avl import AVLTreeNode
+from bisect import bisect_left, insort
 from collections import deque
+from operator import add
+from random import randint, random
+from time import time
+
+
+# How to combine each aggregate of two subtrees,
+# and the aggregate of an empty range
+AGGREGATES = {
+  'count': (add, 0),
+  'sum': (add, 0),
+  'min': (min, None),
+  'max': (max, None),
+}
 
 
 class RangeTreeNode(AVLTreeNode):
@@ -26,9 +53,101 @@ class RangeTreeNode(AVLTreeNode):
   RangeTreeNode inherits properties from the AVLTreeNode
   but has a modified search method
 
+  count and sum are the number and the sum of the keys
+  stored in the leaves of the subtree, like min and max
+
   """
   def __init__(self, key):
     AVLTreeNode.__init__(self, key)
+    self.count = 1
+    self.sum = key
+
+  def is_leaf(self):
+    return self.left is None and self.right is None
+
+  def _update(self):
+    """
+    Recompute count and sum from the children
+    along with the AVLTreeNode augmentations
+
+    """
+    AVLTreeNode._update(self)
+    if self.is_leaf():
+      self.count = 1
+      self.sum = self.key
+    else:
+      self.count = (0 if self.left is None else self.left.count) \
+        + (0 if self.right is None else self.right.count)
+      self.sum = (0 if self.left is None else self.left.sum) \
+        + (0 if self.right is None else self.right.sum)
+
+  def _create_new(self, key):
+    """
+    Create a new instance of a node
+
+    """
+    return RangeTreeNode(key)
+
+  def _insert(self, key):
+    """
+    Leaf-oriented insert, the search for the key ends
+    at a leaf, which is replaced by a new internal node
+    whose children are that leaf and a new leaf for the
+    key. The nodes on the path are rebalanced on the way
+    back up
+
+    Complexity: O(log(N))
+
+    """
+    if self.is_leaf():
+      if key == self.key:
+        return self
+      leaf = self._create_new(key)
+      node = self._create_new(min(key, self.key))
+      node.parent = self.parent
+      if key < self.key:
+        node.left, node.right = leaf, self
+      else:
+        node.left, node.right = self, leaf
+      node.left.parent = node.right.parent = node
+      node._update()
+      return node
+    if key <= self.key:
+      self.left = self.left._insert(key)
+      self.left.parent = self
+    else:
+      self.right = self.right._insert(key)
+      self.right.parent = self
+    return self._balance()
+
+  def _delete(self, key):
+    """
+    Leaf-oriented delete, the leaf with the key is
+    removed and its sibling takes its parent's place.
+    The key of each node on the path is reset to the
+    max of its left subtree, which may have been the
+    deleted key, then the node is rebalanced
+
+    Complexity: O(log(N))
+
+    """
+    if self.is_leaf():
+      return None if key == self.key else self
+    if key <= self.key:
+      child = self.left._delete(key)
+      if child is None:
+        self.right.parent = self.parent
+        return self.right
+      self.left = child
+    else:
+      child = self.right._delete(key)
+      if child is None:
+        self.left.parent = self.parent
+        return self.left
+      self.right = child
+    child.parent = self
+    self.key = self.left.max
+    return self._balance()
 
   def search(self, key):
     """
@@ -60,6 +179,35 @@ class RangeTree(object):
   def __init__(self, L):
     self.root = RangeTree.build(L)
 
+  def __len__(self):
+    return 0 if self.root is None else self.root.count
+
+  def insert(self, key):
+    """
+    Insert a key into the tree, keys
+    already in the tree are ignored
+
+    Complexity: O(log(N))
+
+    """
+    if self.root is None:
+      self.root = RangeTreeNode(key)
+    else:
+      self.root = self.root.insert(key)
+
+  def delete(self, key):
+    """
+    Delete a key from the tree, does nothing
+    if the key is not in the tree
+
+    Complexity: O(log(N))
+
+    """
+    if self.root is None:
+      raise KeyError(
+        'Cannot delete key {} from an empty tree'.format(key))
+    self.root = self.root.delete(key)
+
   @staticmethod
   def build(L):
     """
@@ -74,34 +222,19 @@ class RangeTree(object):
       return RangeTreeNode(L[0])
     if n == 2:
       node = RangeTreeNode(L[0])
-      node.min = L[0]
-      node.max = L[1]
       node.left = RangeTreeNode(L[0])
-      node.left.min = node.left.max = L[0]
       node.right = RangeTreeNode(L[1])
-      node.right.min = node.right.max = L[1]
       node.left.parent = node.right.parent = node
+      node._update()
       return node
 
-    mid = n // 2
-    if n == 1:
-      return
+    mid = (n - 1) // 2  # the left half gets the extra key so heights differ by <= 1
     node = RangeTreeNode(L[mid])
-    node.min = L[0]
-    node.max = L[-1]
-
-    L_left = L[:mid + 1]
-    node.left = RangeTree.build(L_left)
+    node.left = RangeTree.build(L[:mid + 1])
     node.left.parent = node
-    node.left.min = L_left[0]
-    node.left.max = L_left[-1]
-
-    L_right = L[mid + 1:]
-    node.right = RangeTree.build(L_right)
+    node.right = RangeTree.build(L[mid + 1:])
     node.right.parent = node
-    node.right.min = L_right[0]
-    node.right.max = L_right[-1]
-
+    node._update()  # min, max, size, and height from the children
     return node
 
   def _lowest_common_ancestor(self, left, right):
@@ -146,3 +279,158 @@ class RangeTree(object):
         trees.append(cur.left)
       cur = cur.parent
     return (list(nodes), list(trees))
+
+  def range_aggregate(self, lo, hi, op):
+    """
+    Return the count, sum, min, or max (op) of the keys
+    in [lo, hi], 0 for an empty count or sum and None
+    for an empty min or max
+
+    Walks down to the node where the paths to lo and hi
+    split, then down both paths, combining the aggregates
+    of the subtrees hanging between them
+
+    Complexity: O(log(N))
+
+    """
+    if op not in AGGREGATES:
+      raise ValueError(
+        'unknown aggregate {}'.format(op))
+    combine, result = AGGREGATES[op]
+    node = self.root
+    if node is None or lo > hi:
+      return result
+    while not node.is_leaf() and (hi <= node.key or lo > node.key):
+      node = node.left if hi <= node.key else node.right
+    if node.is_leaf():
+      return getattr(node, op) if lo <= node.key <= hi else result
+
+    # every subtree right of the path to lo is in the range
+    v = node.left
+    while not v.is_leaf():
+      if lo <= v.key:
+        value = getattr(v.right, op)
+        result = value if result is None else combine(result, value)
+        v = v.left
+      else:
+        v = v.right
+    if v.key >= lo:
+      value = getattr(v, op)
+      result = value if result is None else combine(result, value)
+
+    # every subtree left of the path to hi is in the range
+    v = node.right
+    while not v.is_leaf():
+      if hi > v.key:
+        value = getattr(v.left, op)
+        result = value if result is None else combine(result, value)
+        v = v.right
+      else:
+        v = v.left
+    if v.key <= hi:
+      value = getattr(v, op)
+      result = value if result is None else combine(result, value)
+    return result
+
+  def range_count(self, lo, hi):
+    """
+    Return the number of keys in [lo, hi]
+
+    Complexity: O(log(N))
+
+    """
+    return self.range_aggregate(lo, hi, 'count')
+
+  def iter_range(self, lo, hi):
+    """
+    Lazily yield the keys in [lo, hi] in order, moving
+    from each leaf to the next by parent pointers
+
+    Complexity: O(log(N) + K) where K is the number of keys yielded
+
+    """
+    if self.root is None:
+      return
+    node = self.root.search(lo)
+    if node.key < lo:
+      node = self._next_leaf(node)
+    while node is not None and node.key <= hi:
+      yield node.key
+      node = self._next_leaf(node)
+
+  @staticmethod
+  def _next_leaf(node):
+    """
+    Return the leaf after node, or None if it is the last
+
+    """
+    while node.parent is not None and node.parent.right is node:
+      node = node.parent
+    if node.parent is None:
+      return None
+    node = node.parent.right
+    while not node.is_leaf():
+      node = node.left
+    return node
+
+
+def benchmark(n=10 ** 4, ops=2000, query_ratio=0.5):
+  """
+  Run a mixed workload of random inserts, deletes, and
+  range counts on n keys, once with insert and delete
+  on the tree, and once keeping a sorted list and
+  rebuilding the tree from it before each query
+  that follows an update
+
+  """
+  keys = sorted(set(randint(0, 10 * n) for _ in range(n)))
+  workload = []
+  for _ in range(ops):
+    if random() < query_ratio:
+      lo = randint(0, 10 * n)
+      workload.append(('query', lo, lo + randint(0, n)))
+    else:
+      workload.append((
+        'insert' if random() < 0.5 else 'delete', randint(0, 10 * n), None))
+
+  start = time()
+  t = RangeTree(keys)
+  dynamic = []
+  for op, key, hi in workload:
+    if op == 'insert':
+      t.insert(key)
+    elif op == 'delete':
+      t.delete(key)
+    else:
+      dynamic.append(t.range_count(key, hi))
+  dynamic_time = time() - start
+
+  start = time()
+  L = list(keys)
+  t = RangeTree(L)
+  dirty = False
+  rebuilt = []
+  for op, key, hi in workload:
+    i = bisect_left(L, key)
+    present = i < len(L) and L[i] == key
+    if op == 'insert' and not present:
+      insort(L, key)
+      dirty = True
+    elif op == 'delete' and present:
+      del L[i]
+      dirty = True
+    elif op == 'query':
+      if dirty:
+        t = RangeTree(L)
+        dirty = False
+      rebuilt.append(t.range_count(key, hi))
+  rebuild_time = time() - start
+
+  if dynamic != rebuilt:
+    raise Exception('dynamic range tree returned a wrong count')
+  print('{} keys, {} operations: {:.2f}s dynamic, {:.2f}s rebuilding'.format(
+    n, ops, dynamic_time, rebuild_time))
+
+
+if __name__ == '__main__':
+  benchmark()
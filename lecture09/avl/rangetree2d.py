@@ -0,0 +1,280 @@
+"""
+Lecture 9: Augmentation
+2-D Range Tree
+--------------
+A static 2-D range tree which reports or counts
+the points (x, y) in a rectangle x1 <= x <= x2,
+y1 <= y <= y2
+
+The points are sorted by x, and each node of a
+balanced tree over the sorted points keeps the
+points of its subtree sorted by y, its associated
+list. A query splits [x1, x2] into O(log(N))
+subtrees, and searches each subtree's list for
+[y1, y2]. With one binary search per subtree that
+takes O(log(N) ** 2) time.
+
+Fractional cascading removes all but the first
+binary search. Each entry of a node's list also
+stores the number of entries of its left child's
+list which are smaller, which is the position of
+the same y in the left child's list, and the
+position in the right child's list follows from
+it. So the positions of y1 and y2 are found once
+at the root and carried down, and a query takes
+O(log(N) + K) time to report K points, or
+O(log(N)) time to count them.
+
+The tree uses O(N * log(N)) space and takes
+O(N * log(N)) time to build.
+
+"""
+
+
+from bisect import bisect_left, bisect_right
+from random import randint
+from time import time
+
+import numpy as np
+
+
+class RangeTree2D(object):
+  """
+  Static 2-D range tree over a list of (x, y) points
+
+  The tree is stored level by level. Level l splits the
+  x-sorted points into blocks of 2 ** l consecutive points,
+  block b of level l is the node whose children are blocks
+  2 * b and 2 * b + 1 of level l - 1, and the root is the
+  single block of the top level. Y[l] holds every block's
+  associated list, the y values of its points in sorted
+  order, I[l] holds the index of each of those points in
+  the input, and P[l] holds the cascading pointers into
+  the left children's lists
+
+  Queries return indices into the input list of points
+
+  """
+  def __init__(self, points):
+    order = sorted(range(len(points)), key=lambda k: points[k])
+    self.n = len(points)
+    self.X = [points[k][0] for k in order]
+    self.Y = [[points[k][1] for k in order]]
+    self.I = [order]
+    self.P = [None]
+    while (1 << (len(self.Y) - 1)) < self.n:
+      self._merge_level()
+
+  def _merge_level(self):
+    """
+    Build the next level by merging the lists of each pair
+    of sibling blocks, recording how many entries of the
+    left list come before each entry of the merged list
+
+    Ties take the entry from the left list first, so every
+    pointer at the start of a run of equal y values is the
+    position of that y in the left list
+
+    Complexity: O(N)
+
+    """
+    l = len(self.Y)
+    Y, I = self.Y[-1], self.I[-1]
+    merged_y, merged_i, pointers = [], [], []
+    half = 1 << (l - 1)
+    for s in range(0, self.n, 2 * half):
+      a, mid = s, min(s + half, self.n)
+      b, e = mid, min(s + 2 * half, self.n)
+      while a < mid or b < e:
+        pointers.append(a - s)
+        if b == e or (a < mid and Y[a] <= Y[b]):
+          merged_y.append(Y[a])
+          merged_i.append(I[a])
+          a += 1
+        else:
+          merged_y.append(Y[b])
+          merged_i.append(I[b])
+          b += 1
+    self.Y.append(merged_y)
+    self.I.append(merged_i)
+    self.P.append(pointers)
+
+  @staticmethod
+  def from_arrays(x, y):
+    """
+    Build the tree from NumPy arrays of x and y
+    coordinates, merging every block of a level
+    at once with a stable sort
+
+    Complexity: O(N * log(N) ** 2) vectorized
+
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    t = object.__new__(RangeTree2D)
+    n = t.n = len(x)
+    order = np.lexsort((y, x))
+    positions = np.arange(n)
+    t.X = x[order]
+    t.Y = [y[order]]
+    t.I = [order]
+    t.P = [None]
+    while (1 << (len(t.Y) - 1)) < n:
+      l = len(t.Y)
+      # sort by block of level l, then y, ties keep the left child first
+      perm = np.lexsort((t.Y[-1], positions >> l))
+      is_left = ((perm >> (l - 1)) & 1) == 0
+      before = np.cumsum(is_left) - is_left  # left entries before each position
+      start = (positions >> l) << l
+      t.Y.append(t.Y[-1][perm])
+      t.I.append(t.I[-1][perm])
+      t.P.append(before - before[start])
+    return t
+
+  def _visit(self, l, block, a, b, i, j, out):
+    """
+    Visit the node block of level l whose list entries
+    from a to b - 1 have y in the query range, where the
+    query covers the x-sorted points i to j - 1. If out
+    is a list the matching indices are appended to it,
+    otherwise the number of matching points is returned
+
+    """
+    s = block << l
+    e = min(s + (1 << l), self.n)
+    if a >= b or e <= i or s >= j:
+      return 0
+    if i <= s and e <= j:  # the node's points are all in the x range
+      if out is not None:
+        out.extend(self.I[l][s + a:s + b])
+      return b - a
+    length = e - s
+    left_length = min(1 << (l - 1), length)
+    pa = left_length if a == length else int(self.P[l][s + a])
+    pb = left_length if b == length else int(self.P[l][s + b])
+    count = self._visit(l - 1, 2 * block, pa, pb, i, j, out)
+    if left_length < length:
+      count += self._visit(l - 1, 2 * block + 1, a - pa, b - pb, i, j, out)
+    return count
+
+  def _search(self, x1, x2, y1, y2, out):
+    """
+    Find the x range and the root's y range with the
+    only binary searches, then visit the tree
+
+    """
+    if self.n == 0:
+      return 0
+    i = bisect_left(self.X, x1)
+    j = bisect_right(self.X, x2)
+    a = bisect_left(self.Y[-1], y1)
+    b = bisect_right(self.Y[-1], y2)
+    return self._visit(len(self.Y) - 1, 0, a, b, i, j, out)
+
+  def query(self, x1, x2, y1, y2):
+    """
+    Return the indices of the points with
+    x1 <= x <= x2 and y1 <= y <= y2
+
+    Complexity: O(log(N) + K) where K is the number of points returned
+
+    """
+    out = []
+    self._search(x1, x2, y1, y2, out)
+    return [int(k) for k in out]
+
+  def count(self, x1, x2, y1, y2):
+    """
+    Return the number of points with
+    x1 <= x <= x2 and y1 <= y <= y2
+
+    Complexity: O(log(N))
+
+    """
+    return self._search(x1, x2, y1, y2, None)
+
+  def _search_many(self, rects, out):
+    """
+    Find the x range and the root's y range of every
+    rectangle with vectorized binary searches, then
+    visit the tree once per rectangle
+
+    """
+    rects = np.asarray(rects).reshape(-1, 4)
+    if self.n == 0:
+      return [0] * len(rects)
+    i = np.searchsorted(self.X, rects[:, 0], 'left')
+    j = np.searchsorted(self.X, rects[:, 1], 'right')
+    a = np.searchsorted(self.Y[-1], rects[:, 2], 'left')
+    b = np.searchsorted(self.Y[-1], rects[:, 3], 'right')
+    top = len(self.Y) - 1
+    return [
+      self._visit(top, 0, int(a[k]), int(b[k]), int(i[k]), int(j[k]),
+        None if out is None else out[k])
+      for k in range(len(rects))
+    ]
+
+  def query_many(self, rects):
+    """
+    Answer a query for each row (x1, x2, y1, y2) of
+    rects and return the list of results
+
+    """
+    rects = np.asarray(rects).reshape(-1, 4)
+    out = [[] for _ in range(len(rects))]
+    self._search_many(rects, out)
+    return [[int(k) for k in result] for result in out]
+
+  def count_many(self, rects):
+    """
+    Count the points in each row (x1, x2, y1, y2)
+    of rects and return an array of the counts
+
+    """
+    return np.array(self._search_many(rects, None), dtype=np.int64)
+
+
+def benchmark(n=10 ** 5, queries=1000):
+  """
+  Build the tree over n random points with both
+  constructors, check that they build the same levels,
+  then time count and count_many and check them and
+  query against a scan of every point
+
+  """
+  points = [(randint(0, n), randint(0, n)) for _ in range(n)]
+  start = time()
+  t = RangeTree2D(points)
+  print('built from a list in {:.2f}s'.format(time() - start))
+  x = np.array([p[0] for p in points])
+  y = np.array([p[1] for p in points])
+  start = time()
+  u = RangeTree2D.from_arrays(x, y)
+  print('built from arrays in {:.2f}s'.format(time() - start))
+  if list(t.X) != list(u.X) or len(t.Y) != len(u.Y):
+    raise Exception('the constructors built different trees')
+  for l in range(len(t.Y)):
+    if list(t.Y[l]) != list(u.Y[l]) or list(t.I[l]) != list(u.I[l]) \
+      or (l > 0 and list(t.P[l]) != list(u.P[l])):
+        raise Exception('the constructors built a different level {}'.format(l))
+
+  rects = []
+  for _ in range(queries):
+    x1, y1 = randint(0, n), randint(0, n)
+    rects.append((x1, x1 + randint(0, n // 10), y1, y1 + randint(0, n // 10)))
+  start = time()
+  counts = [t.count(*rect) for rect in rects]
+  print('{} counts in {:.2f}s'.format(queries, time() - start))
+  start = time()
+  many = t.count_many(rects)
+  print('{} counts with count_many in {:.2f}s'.format(queries, time() - start))
+  for rect, c, m in zip(rects[:100], counts, many):
+    x1, x2, y1, y2 = rect
+    expected = np.flatnonzero((x1 <= x) & (x <= x2) & (y1 <= y) & (y <= y2))
+    if c != len(expected) or m != len(expected) \
+      or sorted(t.query(*rect)) != expected.tolist():
+        raise Exception('range tree returned a wrong result')
+
+
+if __name__ == '__main__':
+  benchmark()